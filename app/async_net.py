@@ -0,0 +1,29 @@
+import asyncio
+
+import aiohttp
+
+from app.net import BACKOFF, DEFAULT_TIMEOUT_S, MAX_REQUESTS_PER_HOST, POOL_SIZE, RETRIES, RETRY_STATUSES
+
+
+def create_session(pool_size=POOL_SIZE, max_requests_per_host=MAX_REQUESTS_PER_HOST):
+    """
+    Returns an aiohttp session with the same timeout and connection limits as the blocking session in net, it must be
+    created and closed on the event loop that uses it
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=max_requests_per_host)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT_S))
+
+
+async def get_json(session, url, headers=None, params=None):
+    """
+    Makes a GET request, retrying the same statuses with the same backoff as net, and returns the decoded json body and
+    the response headers. Raises aiohttp.ClientResponseError for error statuses.
+    """
+    for attempt in range(RETRIES + 1):
+        async with session.get(url, headers=headers, params=params) as r:
+            if r.status in RETRY_STATUSES and attempt < RETRIES:
+                await asyncio.sleep(BACKOFF * (2 ** attempt))
+                continue
+
+            r.raise_for_status()
+            return await r.json(content_type=None), r.headers
@@ -0,0 +1,66 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from app.async_net import create_session
+from app.bitbucket_async import BitbucketClient
+from app.errors import ClientRequestError
+from app.github_async import GithubClient
+from app.net import MAX_REQUESTS_PER_HOST, POOL_SIZE
+from app.summary import combine
+
+CONFIG = web.AppKey("config", dict)
+LOGGER = web.AppKey("logger", object)
+SESSION = web.AppKey("session", aiohttp.ClientSession)
+
+
+def create_app(flask_app, pool_size=POOL_SIZE, max_requests_per_host=MAX_REQUESTS_PER_HOST):
+    """
+    Returns an aiohttp application that serves /v1/profile from a single event loop, so a worker is not tied up while
+    waiting on Github and Bitbucket. It uses the config (tokens etc.) and logger of the given Flask application.
+    """
+    aio_app = web.Application()
+    aio_app[CONFIG] = flask_app.config
+    aio_app[LOGGER] = flask_app.logger
+
+    async def client_session(aio_app):
+        aio_app[SESSION] = create_session(pool_size=pool_size, max_requests_per_host=max_requests_per_host)
+        yield
+        await aio_app[SESSION].close()
+
+    aio_app.cleanup_ctx.append(client_session)
+    aio_app.router.add_get("/health-check", health_check)
+    aio_app.router.add_get("/v1/profile", profile)
+
+    return aio_app
+
+
+async def health_check(request):
+    """
+    Endpoint to health check API
+    """
+    request.app[LOGGER].info("Health Check!")
+    return web.Response(text="All Good!")
+
+
+async def profile(request):
+    """
+    Returns the combined organization/team profile from Github and Bitbucket, gathered concurrently.
+
+    If any error occurs in either service, a 400 is returned to the client.
+    """
+    aio_app = request.app
+    entity_name = request.query.get("name")
+    github = GithubClient(aio_app[SESSION], aio_app[CONFIG], aio_app[LOGGER])
+    bitbucket = BitbucketClient(aio_app[SESSION], aio_app[CONFIG], aio_app[LOGGER])
+
+    try:
+        github_summary, bitbucket_summary = await asyncio.gather(github.get(entity_name), bitbucket.get(entity_name))
+    except aiohttp.ClientResponseError as e:
+        aio_app[LOGGER].error("Unable to construct profile: %s", e)
+
+        error = ClientRequestError(str(e))
+        return web.json_response(error.to_dict(), status=error.status_code)
+
+    return web.json_response(combine(github_summary, bitbucket_summary).asdict())
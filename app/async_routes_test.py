@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+import flask
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.async_routes import create_app
+from app.test_data import *
+
+
+def stub_upstream():
+    """
+    A local stand-in for Github and Bitbucket, Github's repos span two pages and Bitbucket's watchers are paginated
+    """
+    async def github_repos(request):
+        if request.query.get("page") == "2":
+            return web.json_response([REPO_PUBLIC_FORK])
+
+        next_url = request.url.with_query(per_page=100, page=2)
+        return web.json_response([REPO_PUBLIC, REPO_PRIVATE], headers={"Link": f'<{next_url}>; rel="next", '
+                                                                              f'<{next_url}>; rel="last"'})
+
+    async def bitbucket_repos(request):
+        watchers_url = request.url.with_path("/2.0/watchers")
+        return web.json_response({"values": [{"is_private": False, "language": "Python",
+                                              "links": {"watchers": {"href": str(watchers_url)}}}]})
+
+    async def bitbucket_watchers(request):
+        if request.query.get("page") == "2":
+            return web.json_response({"values": ["watcher-3"]})
+
+        return web.json_response({"values": ["watcher-1", "watcher-2"],
+                                  "next": str(request.url.with_query(page=2))})
+
+    async def missing(request):
+        return web.json_response({"error": "barf"}, status=404)
+
+    upstream = web.Application()
+    upstream.router.add_get("/orgs/org-1/repos", github_repos)
+    upstream.router.add_get("/orgs/missing/repos", missing)
+    upstream.router.add_get("/2.0/repositories/org-1", bitbucket_repos)
+    upstream.router.add_get("/2.0/repositories/missing", missing)
+    upstream.router.add_get("/2.0/watchers", bitbucket_watchers)
+    return upstream
+
+
+class AsyncRoutesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def get_profile(self, name):
+        async def run():
+            async with TestServer(stub_upstream()) as upstream:
+                flask_app = flask.Flask(__name__)
+                flask_app.config["github_base_url"] = str(upstream.make_url(""))
+                flask_app.config["bitbucket_base_url"] = str(upstream.make_url("/2.0"))
+
+                async with TestClient(TestServer(create_app(flask_app))) as client:
+                    response = await client.get("/v1/profile", params={"name": name})
+                    return response.status, await response.json()
+
+        return self.loop.run_until_complete(run())
+
+    def test_profile(self):
+        status, body = self.get_profile("org-1")
+        self.assertEqual(200, status)
+        self.assertEqual({
+            "forked_repositories": 1,
+            "languages": {
+                "Python": 2,
+                "Javascript": 1
+            },
+            "original_repositories": 2,
+            "topics": {
+                "programming": 2,
+                "fun": 1,
+                "front-end": 1
+            },
+            "watchers_count": 6}, body)
+
+    def test_profile_errors(self):
+        status, body = self.get_profile("missing")
+        self.assertEqual(400, status)
+        self.assertEqual(400, body["status_code"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from app import metrics, net
+from app.mock_upstream import MockUpstream
+
+
+def percentile(values, p):
+    """
+    Returns the nearest rank p-th percentile (0 to 100) of the values
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def run_benchmark(app, upstream, profiles=200, concurrency=8, orgs=10, config=None):
+    """
+    Serves the Flask application from a threaded local server and requests profiles of the given number of distinct
+    organizations from it, round robin, with concurrency clients in parallel. Github and Bitbucket are replaced by the
+    MockUpstream, and any other app config (such as "cache_ttl_s") can be given in config. The app config and summary
+    cache are restored afterwards.
+
+    Returns the p50/p99/max latency in ms, the requests per second, the errors and the upstream calls per profile (in
+    total and by endpoint).
+    """
+    with upstream.serve() as upstream_url:
+        config = {
+            "github_base_url": f"{upstream_url}/github",
+            "github_graphql_url": f"{upstream_url}/github/graphql",
+            "bitbucket_base_url": f"{upstream_url}/bitbucket/2.0",
+            **(config or {}),
+        }
+        previous_config = {key: app.config[key] for key in config if key in app.config}
+        app.config.update(config)
+        app.extensions.pop("summary_cache", None)
+        net.reset_session()
+        metrics.reset()
+
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, name="benchmark-server", daemon=True)
+        thread.start()
+        try:
+            return _drive(f"http://127.0.0.1:{server.server_port}", upstream, profiles, concurrency, orgs)
+        finally:
+            server.shutdown()
+            thread.join()
+            for key in config:
+                app.config.pop(key, None)
+            app.config.update(previous_config)
+            app.extensions.pop("summary_cache", None)
+
+
+def _drive(url, upstream, profiles, concurrency, orgs):
+    local = threading.local()
+
+    def get_profile(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+
+        start = time.perf_counter()
+        r = local.session.get(f"{url}/v1/profile", params={"name": f"org-{i % orgs}"})
+        return time.perf_counter() - start, r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(get_profile, range(profiles)))
+    elapsed_s = time.perf_counter() - start
+
+    latencies_ms = [seconds * 1000 for seconds, _ in results]
+    return {
+        "profiles": profiles,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, status in results if status != 200),
+        "p50_ms": round(percentile(latencies_ms, 50), 1),
+        "p99_ms": round(percentile(latencies_ms, 99), 1),
+        "max_ms": round(max(latencies_ms), 1),
+        "requests_per_s": round(profiles / elapsed_s, 1),
+        "upstream_calls_per_profile": round(upstream.total_calls() / profiles, 2),
+        "upstream_calls": dict(upstream.calls),
+    }
+
+
+def create_upstream(args):
+    return MockUpstream(repos_per_org=args.repos, github_page_size=args.github_page_size,
+                        bitbucket_page_size=args.bitbucket_page_size, watchers_per_repo=args.watchers,
+                        watcher_page_size=args.watcher_page_size, watcher_size=not args.no_watcher_size,
+                        latency_s=args.latency_ms / 1000, tail_ratio=args.tail_ratio,
+                        tail_latency_s=args.tail_latency_ms / 1000)
@@ -0,0 +1,50 @@
+import unittest
+
+import flask
+
+from app import github_api, github_graphql
+from app.benchmark import percentile, run_benchmark
+from app.mock_upstream import MockUpstream
+from app.routes import app
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(7, percentile([7], 99))
+
+    def test_run_benchmark(self):
+        upstream = MockUpstream(repos_per_org=25, github_page_size=10, bitbucket_page_size=10, watchers_per_repo=3,
+                                watcher_page_size=2, watcher_size=False, latency_s=0)
+
+        report = run_benchmark(app, upstream, profiles=4, concurrency=2, orgs=2, config={"cache_ttl_s": 0})
+
+        self.assertEqual(0, report["errors"])
+        # a provider's summary requested while the same organization's is loading shares that load, so each provider
+        # loads between once per organization and once per profile: 3 Github pages per load, and 3 Bitbucket pages
+        # and 2 pages of watchers for each of the 25 repositories per load
+        github_loads = report["upstream_calls"]["github_repos"] // 3
+        bitbucket_loads = report["upstream_calls"]["bitbucket_repos"] // 3
+        self.assertTrue(2 <= github_loads <= 4)
+        self.assertTrue(2 <= bitbucket_loads <= 4)
+        self.assertEqual({"github_repos": 3 * github_loads, "bitbucket_repos": 3 * bitbucket_loads,
+                          "bitbucket_watchers": 50 * bitbucket_loads}, report["upstream_calls"])
+        self.assertEqual(round((3 * github_loads + 53 * bitbucket_loads) / 4, 2), report["upstream_calls_per_profile"])
+
+    def test_mock_upstream_summary(self):
+        upstream = MockUpstream(repos_per_org=10, latency_s=0)
+        with upstream.serve() as upstream_url:
+            mock_app = flask.Flask(__name__)
+            mock_app.config["github_base_url"] = f"{upstream_url}/github"
+            mock_app.config["github_graphql_url"] = f"{upstream_url}/github/graphql"
+
+            with mock_app.app_context():
+                self.assertEqual(github_api.get("org-1"), github_graphql.get("org-1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
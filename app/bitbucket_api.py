@@ -1,10 +1,23 @@
+import functools
+import threading
+
 from flask import current_app
 
-from app.net import get_session
-from app.summary import OrgSummary
+from app.json_stream import parse_projected
+from app.logs import log_upstream_call
+from app.metrics import upstream_call
+from app.net import cancellable, conditional_get
+from app.rate_limit import next_credentials
+from app.summary import summarize
+from app.workers import cancel_pending, fan_out_executor, with_app_context
 
 
 BASE_URL = "https://api.bitbucket.org/2.0"
+WATCHER_WORKERS = 10
+MAX_PAGE_LENGTH = 100
+REPO_FIELDS = ("is_private", "language", "parent.full_name", "links.watchers.href")
+WATCHER_FIELDS = ("uuid",)
+PAGINATION_FIELDS = ("size", "next")
 
 
 class PaginatedResponse(object):
@@ -14,8 +27,10 @@ class PaginatedResponse(object):
     See https://developer.atlassian.com/bitbucket/api/2/reference/meta/pagination
     """
 
-    def __init__(self, json_response):
+    def __init__(self, json_response, fields=None, endpoint="repos"):
         self.json_response = json_response
+        self.fields = fields
+        self.endpoint = endpoint
         self.result_size = self.json_response.get("size", -1)
 
     def __iter__(self):
@@ -27,7 +42,9 @@ class PaginatedResponse(object):
 
         values = self.json_response["values"]
         next_page_url = self.json_response.get("next")
-        self.json_response = call_bitbucket(next_page_url) if next_page_url else None
+        self.json_response = None
+        if next_page_url:
+            self.json_response = call_bitbucket(next_page_url, fields=self.fields, endpoint=self.endpoint)
         return values
 
     def size(self):
@@ -38,28 +55,59 @@ class PaginatedResponse(object):
 
 
 def get(organization_name):
-    org_summary = OrgSummary()
-    for repo in get_repos(organization_name):
-        repo_summary = parse_repo(repo)
-        repo_summary["watchers_count"] = get_watchers_count(repo_summary.pop("watchers_ref"))
-        org_summary.accumulate(repo_summary)
+    return summarize(get_repo_summaries(organization_name))
+
 
-    return org_summary
+def get_repo_summaries(organization_name):
+    """
+    Generator of the summary of each of the team's repositories, including its watcher count. The watcher lookups are
+    fanned out to a pool of worker threads as the repository pages arrive, the pool size is configured with the
+    "bitbucket_watcher_workers" app config.
+
+    The repositories are listed in the largest pages Bitbucket allows, projected down to the fields parse_repo reads
+    both by Bitbucket and when parsing the pages. Once the summaries are no longer consumed, because they are complete
+    or a lookup failed, the watcher lookups still running are cancelled before their next page.
+    """
+    workers = current_app.config.get("bitbucket_watcher_workers", WATCHER_WORKERS)
+    cancel = threading.Event()
+    watchers_count = with_app_context(cancellable(get_watchers_count, cancel))
+
+    pending = []
+    with fan_out_executor(workers) as executor:
+        try:
+            for repo in get_repos(organization_name, fields=REPO_FIELDS):
+                repo_summary = parse_repo(repo)
+                watchers_ref = repo_summary.pop("watchers_ref")
+                pending.append((repo_summary, executor.submit(watchers_count, watchers_ref)))
+
+            for repo_summary, future in pending:
+                repo_summary["watchers_count"] = future.result()
+                yield repo_summary
+        finally:
+            cancel.set()
+            cancel_pending(future for _, future in pending)
 
 
 def parse_repo(repo_data):
-    return {
+    repo_summary = {
         "private": repo_data.get("is_private", False),
         "language": repo_data.get("language", None),
         "fork": "parent" in repo_data,
         "watchers_ref": repo_data.get("links", {}).get("watchers", {}).get("href", "")
     }
 
+    return repo_summary
+
+
+def get_repos(organization_name, fields=None):
+    """
+    Generator of the team's raw repositories, optionally projected down to the given fields
+    """
+    url = f"{current_app.config.get('bitbucket_base_url', BASE_URL)}/repositories/{organization_name}"
 
-def get_repos(organization_name):
-    url = f"{BASE_URL}/repositories/{organization_name}"
+    json_response = call_bitbucket(url, params=get_page_params(fields), fields=fields)
 
-    for values in PaginatedResponse(call_bitbucket(url)):
+    for values in PaginatedResponse(json_response, fields=fields):
         for repo in values:
             yield repo
 
@@ -75,27 +123,54 @@ def get_watchers_count(watcher_url):
     if not watcher_url:
         return 0
 
-    response = PaginatedResponse(call_bitbucket(watcher_url))
+    json_response = call_bitbucket(watcher_url, params=get_page_params(WATCHER_FIELDS), endpoint="watchers")
+    response = PaginatedResponse(json_response, endpoint="watchers")
     if response.size() >= 0:
         return response.size()
 
     return sum([len(values) for values in response if values])
 
 
-def get_headers():
-    bitbucket_token = current_app.config.get("bitbucket_token")
+def headers_for_token(bitbucket_token):
     if bitbucket_token:
         return {"Authorization": f"Bearer  {bitbucket_token}"}
 
     return {}
 
 
-def call_bitbucket(url):
-    current_app.logger.info("Calling %s", url)
-    r = get_session().get(url, headers=get_headers())
+def get_page_params(fields=None):
+    """
+    Returns the query parameters for the first page of a listing, the largest page length and, if given, the "fields"
+    projection of the values (fields may be dotted paths into the values, such as "links.watchers.href")
+    """
+    params = {"pagelen": MAX_PAGE_LENGTH}
+    if fields is not None:
+        params["fields"] = ",".join(list(PAGINATION_FIELDS) + [f"values.{field}" for field in fields])
+
+    return params
+
+
+def call_bitbucket(url, params=None, fields=None, endpoint="repos"):
+    """
+    Makes an external network call to Bitbucket's API, returning the json response. Pagination urls from a "next" field
+    already carry the query string of the first call, so params are only needed for the first page.
+
+    If fields are given, the page body is parsed as a stream keeping only the pagination fields and the top level of the
+    given fields of each value. Each attempt is made with the token of the "bitbucket_tokens" pool with the most
+    remaining quota, and is timed in the upstream latency metric of the given endpoint ("repos" or "watchers").
+    """
+    log_upstream_call("bitbucket", url)
+    with upstream_call("bitbucket", endpoint) as call:
+        r = conditional_get(url, params=params, hedge_key=("bitbucket", endpoint),
+                            credentials=functools.partial(next_credentials, "bitbucket", headers_for_token))
+        call.bytes = len(r.content)
     r.raise_for_status()
 
-    json_response = r.json()
-    current_app.logger.debug("Got response %s", json_response)
+    if fields is not None:
+        values, json_response = parse_projected(r.content, "values.item", {field.split(".")[0] for field in fields},
+                                                PAGINATION_FIELDS)
+        json_response["values"] = values
+    else:
+        json_response = r.json()
 
     return json_response
@@ -76,6 +76,33 @@ class BitbucketApiTestCase(unittest.TestCase):
                 "watchers_count": 0}, get("org-1").asdict())
             self.assertEqual(1, len(responses.calls))
 
+    @responses.activate
+    def test_get_with_watchers(self):
+        with app.app_context():
+            repos = [{"is_private": False, "language": "Python",
+                      "links": {"watchers": {"href": f"http://watchers-{i}"}}} for i in range(5)]
+            responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                          json={"values": repos}, status=200)
+            for i in range(5):
+                responses.add(responses.GET, f"http://watchers-{i}", json={"size": i, "values": []}, status=200)
+
+            summary = get("org-1")
+            self.assertEqual(10, summary.watchers)
+            self.assertEqual(5, summary.original_repositories)
+            self.assertEqual(6, len(responses.calls))
+            self.assertIn("fields=", responses.calls[0].request.url)
+            self.assertIn("pagelen=100", responses.calls[0].request.url)
+
+    @responses.activate
+    def test_get_watchers_errors_raised(self):
+        with app.app_context():
+            responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                          json={"values": [{"links": {"watchers": {"href": "http://watchers"}}}]}, status=200)
+            responses.add(responses.GET, "http://watchers", json={"error": "barf"}, status=404)
+
+            with self.assertRaises(HTTPError):
+                get("org-1")
+
     @responses.activate
     def test_get_watchers_count(self):
         with app.app_context():
@@ -0,0 +1,109 @@
+import asyncio
+
+from app.async_net import get_json
+from app.bitbucket_api import (BASE_URL, REPO_FIELDS, WATCHER_FIELDS, WATCHER_WORKERS, get_page_params,
+                               headers_for_token, parse_repo)
+from app.logs import log_upstream_call
+from app.summary import OrgSummary
+
+
+class AsyncPaginatedResponse(object):
+    """
+    The asyncio counterpart of bitbucket_api.PaginatedResponse, an async iterator over the values of each page.
+
+    See https://developer.atlassian.com/bitbucket/api/2/reference/meta/pagination
+    """
+
+    def __init__(self, client, json_response):
+        self.client = client
+        self.json_response = json_response
+        self.result_size = self.json_response.get("size", -1)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.json_response:
+            raise StopAsyncIteration
+
+        values = self.json_response["values"]
+        next_page_url = self.json_response.get("next")
+        self.json_response = await self.client.call_bitbucket(next_page_url) if next_page_url else None
+        return values
+
+    def size(self):
+        """
+        Returns the size of the result set if available, -1 otherwise
+        """
+        return self.result_size
+
+
+class BitbucketClient(object):
+    """
+    The asyncio counterpart of bitbucket_api. Rather than reading the Flask application context it is given the session,
+    app config and logger to use.
+    """
+
+    def __init__(self, session, config, logger):
+        self.session = session
+        self.headers = headers_for_token(config.get("bitbucket_token"))
+        self.watcher_workers = config.get("bitbucket_watcher_workers", WATCHER_WORKERS)
+        self.logger = logger
+        self.config = config
+        self.base_url = config.get("bitbucket_base_url", BASE_URL)
+
+    async def get(self, organization_name):
+        """
+        Builds the team summary, the watcher lookups are gathered concurrently with at most "bitbucket_watcher_workers"
+        in flight
+        """
+        limit = asyncio.Semaphore(self.watcher_workers)
+
+        async def with_watchers(repo_summary):
+            watchers_ref = repo_summary.pop("watchers_ref")
+            async with limit:
+                repo_summary["watchers_count"] = await self.get_watchers_count(watchers_ref)
+            return repo_summary
+
+        lookups = []
+        try:
+            async for repo in self.get_repos(organization_name, fields=REPO_FIELDS):
+                lookups.append(asyncio.ensure_future(with_watchers(parse_repo(repo))))
+
+            org_summary = OrgSummary()
+            for repo_summary in await asyncio.gather(*lookups):
+                org_summary.accumulate(repo_summary)
+        except BaseException:
+            for lookup in lookups:
+                lookup.cancel()
+            raise
+
+        return org_summary
+
+    async def get_repos(self, organization_name, fields=None):
+        url = f"{self.base_url}/repositories/{organization_name}"
+        json_response = await self.call_bitbucket(url, params=get_page_params(fields))
+
+        async for values in AsyncPaginatedResponse(self, json_response):
+            for repo in values:
+                yield repo
+
+    async def get_watchers_count(self, watcher_url):
+        """
+        Given a watcher URL, calculate the total number of watchers, see bitbucket_api.get_watchers_count
+        """
+        if not watcher_url:
+            return 0
+
+        response = AsyncPaginatedResponse(self, await self.call_bitbucket(watcher_url,
+                                                                         params=get_page_params(WATCHER_FIELDS)))
+        if response.size() >= 0:
+            return response.size()
+
+        return sum([len(values) async for values in response if values])
+
+    async def call_bitbucket(self, url, params=None):
+        log_upstream_call("bitbucket", url, logger=self.logger, config=self.config)
+        json_response, _ = await get_json(self.session, url, headers=self.headers, params=params)
+
+        return json_response
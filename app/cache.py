@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+from flask import current_app
+
+
+DEFAULT_TTL_S = 300
+DEFAULT_MAX_ENTRIES = 1000
+
+_extension_lock = threading.Lock()
+
+
+class TTLCache(object):
+    """
+    A thread safe, in-process cache whose entries expire after a time to live (never if it is None) and which evicts the
+    least recently used entry once it holds max_entries.
+
+    Concurrent misses for the same key are coalesced by get_or_load, so only one caller runs the loader while the others
+    wait for its result.
+    """
+
+    def __init__(self, ttl_s=DEFAULT_TTL_S, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._refreshing = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """
+        Returns the cached value for key like get, but without counting a hit or miss
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            return value if found else default
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader to produce and cache it on a miss.
+
+        If another thread is already loading the same key this waits for and shares its result (or error) instead.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+
+            future = self._loading.get(key)
+            if future is None:
+                self.misses += 1
+                future = self._loading[key] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, value)
+            del self._loading[key]
+        future.set_result(value)
+
+        return value
+
+    def refresh(self, key, loader):
+        """
+        Replaces the cached value for key with one produced by loader, returning whether it did. Nothing is loaded if
+        the key is already being refreshed. A get_or_load of the key in progress is waited for first, so the value it
+        stores cannot overwrite the refreshed one.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            loading = self._loading.get(key)
+
+        try:
+            if loading is not None:
+                wait([loading])
+            value = loader()
+            with self._lock:
+                self._store(key, value)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+        return True
+
+    def time_to_live(self, key):
+        """
+        Returns the seconds until the cached value for key expires (infinite if it never does), or None if it is not
+        cached. Unlike get it is not counted as a hit or miss, nor does it make the entry recently used.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at = entry[0]
+            if expires_at is None:
+                return float("inf")
+
+            remaining = expires_at - self._clock()
+            return remaining if remaining > 0 else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= self._clock():
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        if self.max_entries <= 0:
+            return
+
+        expires_at = None if self.ttl_s is None else self._clock() + self.ttl_s
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+def get_summary_cache():
+    """
+    Returns the org summary cache of the current Flask application, created on first use from the "cache_ttl_s" and
+    "cache_max_entries" app config. With a "cache_socket" app config the cache is the "summaries" namespace of the
+    shared cache server at that path (see shared_cache), so every worker process on the node shares it, otherwise it is
+    an in-process TTLCache.
+    """
+    app = current_app._get_current_object()
+    with _extension_lock:
+        if "summary_cache" not in app.extensions:
+            app.extensions["summary_cache"] = create_cache("summaries", app.config.get("cache_ttl_s", DEFAULT_TTL_S),
+                                                           app.config.get("cache_max_entries", DEFAULT_MAX_ENTRIES),
+                                                           socket_path=app.config.get("cache_socket"))
+
+        return app.extensions["summary_cache"]
+
+
+def create_cache(namespace, ttl_s=DEFAULT_TTL_S, max_entries=DEFAULT_MAX_ENTRIES, socket_path=None):
+    """
+    Returns a cache backed by the shared cache server at socket_path, caching in the given namespace, or by an
+    in-process TTLCache if there is no socket_path. Both backends have the same interface.
+    """
+    if not socket_path:
+        return TTLCache(ttl_s=ttl_s, max_entries=max_entries)
+
+    from app.shared_cache import SharedCache
+
+    return SharedCache(socket_path, namespace, ttl_s=ttl_s, max_entries=max_entries)
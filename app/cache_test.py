@@ -0,0 +1,109 @@
+import threading
+import time
+import unittest
+
+from app.cache import TTLCache
+from app.test_data import FakeClock
+
+
+class TTLCacheTestCase(unittest.TestCase):
+
+    def test_get_or_load(self):
+        cache = TTLCache()
+        self.assertEqual("value", cache.get_or_load("key", lambda: "value"))
+        self.assertEqual("value", cache.get_or_load("key", lambda: "other"))
+        self.assertEqual({"entries": 1, "hits": 1, "misses": 1, "coalesced": 0, "evictions": 0}, cache.stats())
+
+    def test_peek_not_counted(self):
+        cache = TTLCache()
+        cache.put("key", "value")
+
+        self.assertEqual("value", cache.peek("key"))
+        self.assertEqual("default", cache.peek("missing", "default"))
+        self.assertEqual({"entries": 1, "hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}, cache.stats())
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl_s=10, clock=clock)
+        cache.put("key", "value")
+
+        clock.sleep(9)
+        self.assertEqual("value", cache.get("key"))
+        clock.sleep(1)
+        self.assertIsNone(cache.get("key"))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual(1, cache.stats()["evictions"])
+
+    def test_errors_not_cached(self):
+        cache = TTLCache()
+
+        def barf():
+            raise ValueError("barf")
+
+        with self.assertRaises(ValueError):
+            cache.get_or_load("key", barf)
+        self.assertEqual("value", cache.get_or_load("key", lambda: "value"))
+
+    def test_coalesce_concurrent_misses(self):
+        cache = TTLCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "value"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader)))
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader)))
+        follower.start()
+        while cache.stats()["coalesced"] == 0:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(["value", "value"], results)
+        self.assertEqual(1, len(calls))
+
+    def test_refresh(self):
+        cache = TTLCache()
+        cache.put("key", "stale")
+        started = threading.Event()
+        release = threading.Event()
+
+        def loader():
+            started.set()
+            release.wait()
+            return "fresh"
+
+        results = []
+        refresh = threading.Thread(target=lambda: results.append(cache.refresh("key", loader)))
+        refresh.start()
+        started.wait()
+        # a refresh already in progress is not repeated
+        self.assertFalse(cache.refresh("key", lambda: "other"))
+        release.set()
+        refresh.join()
+
+        self.assertEqual([True], results)
+        self.assertEqual("fresh", cache.get("key"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Sets a deadline seconds from now for the work done in the body of the with statement, or clears it if seconds is
+    None. A profile request waits for its providers until its deadline, while their loads (see
+    profiles.get_summary_later) and background refreshes clear it, so they always run to completion.
+    """
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    Returns the seconds left until the current deadline (possibly negative once it has passed), or None if there is none
+    """
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
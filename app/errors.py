@@ -13,3 +13,15 @@ class ClientRequestError(Exception):
             "message": self.message,
             "status_code": self.status_code
         }
+
+
+class UpstreamRateLimitedError(ClientRequestError):
+    """
+    Maps to a 503 when a request could not be made within an upstream rate limit, retry_after_s is how long until the
+    limit resets and is returned in the Retry-After header
+    """
+    status_code = 503
+
+    def __init__(self, message, retry_after_s=None):
+        ClientRequestError.__init__(self, message)
+        self.retry_after_s = retry_after_s
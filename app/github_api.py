@@ -1,31 +1,68 @@
+import functools
+import itertools
 import re
+import threading
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from flask import current_app
 
-from app.net import get_session
-from app.summary import OrgSummary
+from app.json_stream import iter_projected
+from app.logs import log_upstream_call
+from app.metrics import upstream_call
+from app.net import cancellable, conditional_get
+from app.rate_limit import next_credentials
+from app.summary import summarize
+from app.workers import cancel_pending, fan_out_executor, with_app_context
 
 
 BASE_URL = "https://api.github.com"
 BASE_HEADERS = {
     "Accept": "application/vnd.github.mercy-preview+json",
 }
-LINK_PATTERN = re.compile('^(?:<[^>]*>; rel="prev", )?<([^>]*)>; rel="next",')
+LINK_PATTERN = re.compile('<([^>]*)>; rel="([^"]*)"')
 MAX_RESULTS = 100
+REPO_FIELDS = ("private", "language", "fork", "watchers_count", "topics")
+VERSION_FIELDS = ("id", "updated_at")
+PAGE_WORKERS = 4
 
 
 def get(organization_name):
-    org_summary = OrgSummary()
-    for repo in get_repos(organization_name):
-        org_summary.accumulate(parse_repo(repo))
+    return summarize(get_repo_summaries(organization_name))
 
-    return org_summary
 
+def get_repo_summaries(organization_name):
+    """
+    Generator of the summary of each of the organization's repositories, along with its "id" and "updated_at" so it can
+    later be replaced by get_updated_repo_summaries
+    """
+    for repo in get_repos(organization_name, fields=REPO_FIELDS + VERSION_FIELDS):
+        yield parse_versioned_repo(repo)
+
+
+def get_updated_repo_summaries(organization_name, since):
+    """
+    Generator of the summary (with "id" and "updated_at") of each of the organization's repositories updated at or
+    after the since timestamp. Repositories are listed most recently updated first, one page at a time, and the listing
+    stops at the first older repository, so a refresh costs a page or two rather than the full listing.
+    """
+    repos_url = f"{get_base_url()}/orgs/{organization_name}/repos?sort=updated&direction=desc&per_page={MAX_RESULTS}"
 
-def get_repos(organization_name):
-    repos_url = f"{BASE_URL}/orgs/{organization_name}/repos"
+    for page in call_github(repos_url, fields=REPO_FIELDS + VERSION_FIELDS, prefetch=False):
+        for repo in page:
+            if repo.get("updated_at", "") < since:
+                return
+
+            yield parse_versioned_repo(repo)
+
+
+def get_repos(organization_name, fields=None):
+    """
+    Generator of the organization's raw repositories, optionally projected down to the given fields
+    """
+    repos_url = f"{get_base_url()}/orgs/{organization_name}/repos"
 
-    for page in call_github(repos_url):
+    for page in call_github(repos_url, fields=fields):
         for repo in page:
             yield repo
 
@@ -34,47 +71,142 @@ def parse_repo(repo_data):
     """
     Takes a full response from Github's repository API and returns the subset of information needed to provide a summary.
     """
-    return {k: repo_data[k] for k in ("private", "language", "fork", "watchers_count", "topics")}
+    return {k: repo_data[k] for k in REPO_FIELDS}
 
 
-def get_headers():
-    github_token = current_app.config.get("github_token")
+def parse_versioned_repo(repo_data):
+    """
+    Returns the summary of the repository along with the "id" and "updated_at" that identify its version
+    """
+    return {**parse_repo(repo_data), **{k: repo_data.get(k) for k in VERSION_FIELDS}}
+
+
+def get_base_url():
+    """
+    Returns the "github_base_url" app config, so a local stand-in for Github can be used, or else Github's API
+    """
+    return current_app.config.get("github_base_url", BASE_URL)
+
+
+def headers_for_token(github_token):
     if github_token:
         return {**BASE_HEADERS, "Authorization": f"token {github_token}"}
 
     return BASE_HEADERS
 
 
-def call_github(url):
+def call_github(url, fields=None, prefetch=True):
+    """
+    Generator that makes external network calls to Github's API, yielding the json response of each page in order.
+
+    If the response contains a link header, that is used to provide pagination. When it also exposes the last page, the
+    remaining page urls are computed up front and fetched concurrently by "github_page_workers" worker threads,
+    otherwise the next links are followed one page at a time. Pages are requested conditionally, so an unchanged page is
+    served from the last response without counting against the rate limit.
+
+    If fields are given, each page body is parsed as a stream keeping only those fields of each repository. Without
+    prefetch the pages are always fetched one at a time, for consumers that may stop early.
+    """
+    while url:
+        json_response, headers = get_page(url, fields=fields)
+        yield json_response
+
+        links = parse_links(headers.get("Link"))
+        remaining_page_urls = parse_remaining_page_urls(links) if prefetch else []
+        if remaining_page_urls:
+            yield from get_pages(remaining_page_urls, fields=fields)
+            return
+
+        url = links.get("next")
+
+
+def get_page(url, fields=None):
     """
-    Generator that makes an external network call to Github's API, yielding the json response.
+    Makes a single external network call to Github's API, returning the json response (its repositories projected down
+    to the given fields, if any) and the response headers.
 
-    If the response contains a link header, that is used to provide pagination.
+    Pagination urls from the Link header already carry their query string, the page size is only added to the first url.
+    Each attempt is made with the token of the "github_tokens" pool with the most remaining quota.
     """
-    current_app.logger.info("Calling %s with %s", url, get_headers())
-    r = get_session().get(url, headers=get_headers(), params={"per_page": MAX_RESULTS})
+    log_upstream_call("github", url)
+    params = None if urlsplit(url).query else {"per_page": MAX_RESULTS}
+    with upstream_call("github", "repos") as call:
+        r = conditional_get(url, params=params, hedge_key=("github", "repos"),
+                            credentials=functools.partial(next_credentials, "github", headers_for_token))
+        call.bytes = len(r.content)
     r.raise_for_status()
 
-    json_response = r.json()
-    current_app.logger.debug("Got response %s", json_response)
+    json_response = list(iter_projected(r.content, "item", fields)) if fields else r.json()
 
-    yield json_response
+    return json_response, r.headers
 
-    next_page_url = parse_next_page_url(r.headers.get("Link"))
-    current_app.logger.info("next: %s", next_page_url)
-    if next_page_url:
-        yield from call_github(next_page_url)
 
+def get_pages(urls, fields=None):
+    """
+    Generator that fetches the given page urls concurrently, yielding their json responses in the order of the urls.
 
-def parse_next_page_url(link_header):
+    At most twice as many pages as there are workers are fetched ahead of the consumer, so a slow consumer (such as a
+    streamed response) does not cause every page of a large organization to be buffered in memory. Once the consumer
+    stops or a page fails, the pages still being fetched are cancelled.
     """
-    Parse the next URL from the Link header if available, returns false otherwise.
+    workers = current_app.config.get("github_page_workers", PAGE_WORKERS)
+    cancel = threading.Event()
+    get_page_json = with_app_context(cancellable(lambda url: get_page(url, fields=fields)[0], cancel))
+    urls = iter(urls)
+
+    with fan_out_executor(workers) as executor:
+        pages = deque(executor.submit(get_page_json, url) for url in itertools.islice(urls, 2 * workers))
+        try:
+            while pages:
+                page = pages.popleft().result()
+                pages.extend(executor.submit(get_page_json, url) for url in itertools.islice(urls, 1))
+                yield page
+        finally:
+            cancel.set()
+            cancel_pending(pages)
+
+
+def parse_links(link_header):
+    """
+    Parse the urls of a Link header into a dict keyed by their relation (next, last etc.), empty if there are none.
 
     See https://developer.github.com/v3/guides/traversing-with-pagination/ for details on the pagination API.
     """
-    current_app.logger.info("parsing link header: %s", link_header)
     if not link_header:
-        return False
+        return {}
+
+    return {rel: url for url, rel in LINK_PATTERN.findall(link_header)}
+
+
+def parse_next_page_url(link_header):
+    """
+    Parse the next URL from the Link header if available, returns false otherwise.
+    """
+    return parse_links(link_header).get("next", False)
+
+
+def parse_remaining_page_urls(links):
+    """
+    Given the parsed links of a page, returns the urls of every page from the next to the last page inclusive. Returns
+    an empty list if there is no next or last link, or their page numbers cannot be read.
+    """
+    if "next" not in links or "last" not in links:
+        return []
+
+    next_page = _page_number(links["next"])
+    last_page = _page_number(links["last"])
+    if next_page is None or last_page is None:
+        return []
+
+    return [_with_page_number(links["next"], page) for page in range(next_page, last_page + 1)]
+
+
+def _page_number(url):
+    page = dict(parse_qsl(urlsplit(url).query)).get("page", "")
+    return int(page) if page.isdigit() else None
+
 
-    matcher = LINK_PATTERN.match(link_header)
-    return matcher and len(matcher.groups()) == 1 and matcher.group(1)
+def _with_page_number(url, page):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "page"] + [("page", str(page))]
+    return urlunsplit(parts._replace(query=urlencode(query)))
@@ -4,7 +4,7 @@ import flask
 from requests import HTTPError
 import responses
 
-from app.github_api import parse_repo, get_repos, get, parse_next_page_url
+from app.github_api import parse_repo, get_repos, get, parse_next_page_url, parse_links, parse_remaining_page_urls
 from app.test_data import *
 
 
@@ -67,6 +67,39 @@ class GithubApiTestCase(unittest.TestCase):
             self.assertFalse(parse_next_page_url(""))
             self.assertFalse(parse_next_page_url("malformed header value that cannot be parsed"))
 
+    @responses.activate
+    def test_get_repos_follows_next(self):
+        with app.app_context():
+            responses.add(responses.GET, 'https://api.github.com/orgs/org-1/repos',
+                          json=[{'page': 1}], status=200,
+                          headers={"Link": '<https://api.github.com/organizations/1/repos?cursor=a>; rel="next"'})
+            responses.add(responses.GET, 'https://api.github.com/organizations/1/repos',
+                          json=[{'page': 2}], status=200)
+
+            self.assertEqual([{'page': 1}, {'page': 2}], list(get_repos("org-1")))
+            self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_get_repos_prefetches_until_last(self):
+        with app.app_context():
+            page_url = "https://api.github.com/organizations/1/repos?per_page=100&page={}"
+            responses.add(responses.GET, 'https://api.github.com/orgs/org-1/repos',
+                          json=[{'page': 1}], status=200,
+                          headers={"Link": f'<{page_url.format(2)}>; rel="next", <{page_url.format(4)}>; rel="last"'})
+            for page in (2, 3, 4):
+                responses.add(responses.GET, page_url.format(page), json=[{'page': page}], status=200)
+
+            self.assertEqual([{'page': 1}, {'page': 2}, {'page': 3}, {'page': 4}], list(get_repos("org-1")))
+            self.assertEqual(4, len(responses.calls))
+
+    def test_parse_remaining_page_urls(self):
+        page_url = "https://api.github.com/organizations/1/repos?per_page=20&page={}"
+        self.assertEqual([page_url.format(2), page_url.format(3)], parse_remaining_page_urls(
+            parse_links(f'<{page_url.format(2)}>; rel="next", <{page_url.format(3)}>; rel="last"')))
+        self.assertEqual([], parse_remaining_page_urls(parse_links(f'<{page_url.format(2)}>; rel="next"')))
+        self.assertEqual([], parse_remaining_page_urls(
+            parse_links('<https://a?cursor=b>; rel="next", <https://a?cursor=c>; rel="last"')))
+
 
 if __name__ == '__main__':
     unittest.main()
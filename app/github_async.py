@@ -0,0 +1,46 @@
+from urllib.parse import urlsplit
+
+from app.async_net import get_json
+from app.github_api import BASE_URL, MAX_RESULTS, headers_for_token, parse_next_page_url, parse_repo
+from app.logs import log_upstream_call
+from app.summary import OrgSummary
+
+
+class GithubClient(object):
+    """
+    The asyncio counterpart of github_api, with the same Link header pagination. Rather than reading the Flask
+    application context it is given the session, app config and logger to use.
+    """
+
+    def __init__(self, session, config, logger):
+        self.session = session
+        self.headers = headers_for_token(config.get("github_token"))
+        self.logger = logger
+        self.config = config
+        self.base_url = config.get("github_base_url", BASE_URL)
+
+    async def get(self, organization_name):
+        org_summary = OrgSummary()
+        async for repo in self.get_repos(organization_name):
+            org_summary.accumulate(parse_repo(repo))
+
+        return org_summary
+
+    async def get_repos(self, organization_name):
+        repos_url = f"{self.base_url}/orgs/{organization_name}/repos"
+
+        async for page in self.call_github(repos_url):
+            for repo in page:
+                yield repo
+
+    async def call_github(self, url):
+        """
+        Async generator yielding the json response of each page, following the Link header until there is no next page
+        """
+        while url:
+            log_upstream_call("github", url, logger=self.logger, config=self.config)
+            params = None if urlsplit(url).query else {"per_page": MAX_RESULTS}
+            json_response, headers = await get_json(self.session, url, headers=self.headers, params=params)
+            yield json_response
+
+            url = parse_next_page_url(headers.get("Link"))
@@ -0,0 +1,143 @@
+from datetime import datetime, timezone
+
+from flask import current_app
+from requests import HTTPError
+
+from app.github_api import BASE_URL, MAX_RESULTS, headers_for_token
+from app.logs import log_upstream_call
+from app.metrics import upstream_call
+from app.net import limited_post
+from app.rate_limit import GRAPHQL, next_credentials
+from app.summary import summarize
+
+
+GRAPHQL_URL = f"{BASE_URL}/graphql"
+# Github allows at most 20 topics per repository
+MAX_TOPICS = 20
+REPOSITORIES_QUERY = """
+query($organization: String!, $pageSize: Int!, $cursor: String, $orderBy: RepositoryOrder) {
+  rateLimit { remaining resetAt }
+  organization(login: $organization) {
+    repositories(first: $pageSize, after: $cursor, orderBy: $orderBy) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        databaseId
+        updatedAt
+        isPrivate
+        isFork
+        primaryLanguage { name }
+        stargazerCount
+        repositoryTopics(first: %d) { nodes { topic { name } } }
+      }
+    }
+  }
+}
+""" % MAX_TOPICS
+UPDATED_DESC = {"field": "UPDATED_AT", "direction": "DESC"}
+
+
+def get(organization_name):
+    return summarize(get_repo_summaries(organization_name))
+
+
+def get_repo_summaries(organization_name):
+    """
+    Generator of the summary of each of the organization's repositories, along with its "id" and "updated_at", in the
+    same form as github_api so snapshots taken by either backend can be updated by the other
+    """
+    for repo in get_repos(organization_name):
+        yield parse_versioned_repo(repo)
+
+
+def get_updated_repo_summaries(organization_name, since):
+    """
+    Generator of the summary (with "id" and "updated_at") of each of the organization's repositories updated at or
+    after the since timestamp, listing the most recently updated first and stopping at the first older repository
+    """
+    for repo in get_repos(organization_name, order_by=UPDATED_DESC):
+        if repo["updatedAt"] < since:
+            return
+
+        yield parse_versioned_repo(repo)
+
+
+def get_repos(organization_name, fields=None, order_by=None):
+    """
+    Generator of the organization's repositories as returned by the GraphQL API, following the cursor of each page.
+
+    The query already selects only the fields a summary needs, so fields is accepted for compatibility with github_api
+    and ignored.
+    """
+    cursor = None
+    while True:
+        repositories = call_github(organization_name, cursor, order_by)
+        for repo in repositories["nodes"]:
+            yield repo
+
+        if not repositories["pageInfo"]["hasNextPage"]:
+            return
+        cursor = repositories["pageInfo"]["endCursor"]
+
+
+def parse_repo(repo_data):
+    """
+    Takes a repository node of the GraphQL API and returns the same summary as github_api.parse_repo does for the REST
+    API.
+    """
+    language = repo_data.get("primaryLanguage") or {}
+    return {
+        "private": repo_data["isPrivate"],
+        "language": language.get("name"),
+        "fork": repo_data["isFork"],
+        # the REST API's watchers_count is the number of stargazers, GraphQL's watchers are the subscribers
+        "watchers_count": repo_data["stargazerCount"],
+        "topics": [node["topic"]["name"] for node in repo_data["repositoryTopics"]["nodes"]],
+    }
+
+
+def parse_versioned_repo(repo_data):
+    return {**parse_repo(repo_data), "id": repo_data.get("databaseId"), "updated_at": repo_data.get("updatedAt")}
+
+
+def call_github(organization_name, cursor=None, order_by=None):
+    """
+    Makes a single external network call to Github's GraphQL API (the "github_graphql_url" app config), returning the
+    repositories connection of the page after the cursor.
+
+    GraphQL reports errors such as an unknown organization in the body of a successful response, they are raised as an
+    HTTPError like the errors of the REST API.
+
+    The GraphQL API has its own quota per token, apart from the REST API's, so queries are scheduled by the tokens'
+    GraphQL rate limiters. The quota left is read from the rateLimit of each response.
+    """
+    url = current_app.config.get("github_graphql_url", GRAPHQL_URL)
+    variables = {"organization": organization_name, "pageSize": MAX_RESULTS, "cursor": cursor, "orderBy": order_by}
+    limiters = []
+
+    def credentials():
+        headers, limiter = next_credentials("github", headers_for_token, GRAPHQL)
+        limiters.append(limiter)
+        return headers, limiter
+
+    log_upstream_call("github", url, organization=organization_name, cursor=cursor)
+    with upstream_call("github", "repos") as call:
+        r = limited_post(url, json={"query": REPOSITORIES_QUERY, "variables": variables}, credentials=credentials)
+        call.bytes = len(r.content)
+    r.raise_for_status()
+
+    json_response = r.json()
+    update_quota(limiters[-1], (json_response.get("data") or {}).get("rateLimit"))
+    if json_response.get("errors"):
+        messages = "; ".join(error.get("message", "") for error in json_response["errors"])
+        raise HTTPError(f"Github GraphQL error for {organization_name}: {messages}", response=r)
+
+    return json_response["data"]["organization"]["repositories"]
+
+
+def update_quota(limiter, rate_limit):
+    """
+    Updates the limiter from the rateLimit of a query's response, if it has one
+    """
+    if rate_limit:
+        reset_at = datetime.strptime(rate_limit["resetAt"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        limiter.update_quota(rate_limit["remaining"], reset_at.timestamp())
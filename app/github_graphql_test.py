@@ -0,0 +1,122 @@
+import json
+import unittest
+
+import flask
+from requests import HTTPError
+import responses
+
+from app.github_graphql import get, get_repos, get_updated_repo_summaries, parse_repo, update_quota
+from app.rate_limit import GRAPHQL, RateLimiter, get_limiter, reset_limiters
+
+
+GRAPHQL_URL = "http://localhost:8080/graphql"
+
+app = flask.Flask(__name__)
+app.config["github_graphql_url"] = GRAPHQL_URL
+
+
+def repo_node(database_id, updated_at, language="Python", private=False, fork=False, watchers=1, topics=()):
+    return {
+        "databaseId": database_id,
+        "updatedAt": updated_at,
+        "isPrivate": private,
+        "isFork": fork,
+        "primaryLanguage": {"name": language} if language else None,
+        "stargazerCount": watchers,
+        # subscribers, which the REST API's watchers_count does not count
+        "watchers": {"totalCount": 100},
+        "repositoryTopics": {"nodes": [{"topic": {"name": topic}} for topic in topics]},
+    }
+
+
+PAGES = {
+    None: ([repo_node(1, "2020-03-01T00:00:00Z", topics=("api",), watchers=3),
+            repo_node(2, "2020-02-01T00:00:00Z", language=None, fork=True)], "cursor-1"),
+    "cursor-1": ([repo_node(3, "2020-01-01T00:00:00Z", private=True)], None),
+}
+
+
+def stub_graphql(request):
+    """
+    Serves PAGES by their cursor, like Github's GraphQL API
+    """
+    variables = json.loads(request.body)["variables"]
+    if variables["organization"] != "org-1":
+        errors = [{"type": "NOT_FOUND", "message": "Could not resolve to an Organization"}]
+        return 200, {}, json.dumps({"data": {"organization": None}, "errors": errors})
+
+    nodes, end_cursor = PAGES[variables["cursor"]]
+    repositories = {"pageInfo": {"hasNextPage": end_cursor is not None, "endCursor": end_cursor}, "nodes": nodes}
+    rate_limit = {"remaining": 4990, "resetAt": "2100-01-01T00:00:00Z"}
+    return 200, {}, json.dumps({"data": {"rateLimit": rate_limit, "organization": {"repositories": repositories}}})
+
+
+class GithubGraphqlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        responses.add_callback(responses.POST, GRAPHQL_URL, callback=stub_graphql, content_type="application/json")
+
+    def test_parse_repo(self):
+        self.assertEqual({"private": False, "language": None, "fork": True, "watchers_count": 5, "topics": ["a", "b"]},
+                         parse_repo(repo_node(1, "", language=None, fork=True, watchers=5, topics=("a", "b"))))
+
+    def test_update_quota(self):
+        limiter = RateLimiter()
+        update_quota(limiter, None)
+        self.assertIsNone(limiter.remaining)
+
+        update_quota(limiter, {"remaining": 42, "resetAt": "2020-01-01T00:00:00Z"})
+        self.assertEqual(42, limiter.remaining)
+        self.assertEqual(1577836800, limiter.reset_at)
+
+    @responses.activate
+    def test_get_repos_follows_cursors(self):
+        with app.app_context():
+            self.assertEqual([1, 2, 3], [repo["databaseId"] for repo in get_repos("org-1")])
+            self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_get(self):
+        with app.app_context():
+            summary = get("org-1").asdict()
+
+        self.assertEqual({
+            "original_repositories": 1,
+            "forked_repositories": 1,
+            "watchers_count": 4,
+            "languages": {"Python": 1, "No Language Specified": 1},
+            "topics": {"api": 1},
+        }, summary)
+
+    @responses.activate
+    def test_get_updated_repo_summaries_stops_early(self):
+        with app.app_context():
+            updated = list(get_updated_repo_summaries("org-1", "2020-02-15T00:00:00Z"))
+
+        self.assertEqual([1], [repo["id"] for repo in updated])
+        self.assertEqual(1, len(responses.calls))
+        self.assertEqual({"field": "UPDATED_AT", "direction": "DESC"},
+                         json.loads(responses.calls[0].request.body)["variables"]["orderBy"])
+
+    @responses.activate
+    def test_errors_raised(self):
+        with app.app_context():
+            with self.assertRaises(HTTPError):
+                get("org-2")
+
+
+    @responses.activate
+    def test_quota_read_from_response(self):
+        reset_limiters()
+        with app.app_context():
+            list(get_repos("org-1"))
+            limiter = get_limiter("github", None, GRAPHQL)
+            rest_limiter = get_limiter("github", None)
+
+        self.assertEqual(4990, limiter.remaining)
+        self.assertEqual(4102444800, limiter.reset_at)
+        self.assertIsNone(rest_limiter.remaining)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+
+import ijson
+
+
+CONTAINER_STARTS = ("start_map", "start_array")
+CONTAINER_ENDS = ("end_map", "end_array")
+
+
+def iter_projected(body, prefix, fields):
+    """
+    Generator that incrementally parses the json document in body (bytes), yielding a dict for every object found at the
+    ijson prefix (e.g. "item" for the objects of a top level array) that holds only the given fields.
+
+    The document is walked as a stream of parse events and only the values of the requested fields are built into python
+    objects, the other fields are skipped without being decoded. The body itself is the buffered response content, as
+    responses are kept whole to be revalidated (see net.conditional_get), so it is the decoding that is streamed rather
+    than the download.
+    """
+    yield from _project(body, prefix, set(fields), set(), {})
+
+
+def parse_projected(body, prefix, fields, root_fields=()):
+    """
+    Incrementally parses the json document in body (bytes), returning a list with a dict for every object found at the
+    ijson prefix holding only its given fields, and a dict of the given scalar fields of the root object (e.g. the
+    pagination fields of an envelope around the objects).
+
+    Like iter_projected, only the values of the requested fields are built into python objects.
+    """
+    root = {}
+    objects = list(_project(body, prefix, set(fields), set(root_fields), root))
+
+    return objects, root
+
+
+def _project(body, prefix, fields, root_fields, root):
+    current = None
+    field = None
+    builder = None
+    depth = 0
+
+    for path, event, value in ijson.parse(io.BytesIO(body), use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in CONTAINER_STARTS:
+                depth += 1
+            elif event in CONTAINER_ENDS:
+                depth -= 1
+
+            if depth == 0:
+                current[field] = builder.value
+                builder = None
+        elif path == prefix and event == "start_map":
+            current = {}
+        elif path == prefix and event == "end_map":
+            yield current
+            current = None
+        elif path == prefix and event == "map_key" and current is not None and value in fields:
+            field = value
+            builder = ijson.ObjectBuilder()
+        elif path in root_fields and event not in CONTAINER_STARTS and event != "map_key":
+            root[path] = value
@@ -0,0 +1,33 @@
+import json
+import unittest
+
+from app.json_stream import iter_projected, parse_projected
+
+
+class JsonStreamTestCase(unittest.TestCase):
+
+    def test_iter_projected(self):
+        body = json.dumps([{"a": 1, "b": {"a": 2}, "c": ["x", {"y": 1}]},
+                           {"a": None, "b": "skipped"}]).encode()
+
+        self.assertEqual([{"a": 1, "c": ["x", {"y": 1}]}, {"a": None}], list(iter_projected(body, "item", ["a", "c"])))
+
+    def test_iter_projected_skips_other_fields(self):
+        body = b'[{"a": 1, "b": {"deeply": [{"nested": "skipped"}]}}, {"b": [1, 2], "a": 2}]'
+
+        self.assertEqual([{"a": 1}, {"a": 2}], list(iter_projected(body, "item", ["a"])))
+
+    def test_parse_projected(self):
+        body = json.dumps({"size": 2, "values": [{"a": 1.5, "b": [[1], [2]], "c": {"a": 3}},
+                                                 {"a": False, "c": "skipped"}],
+                           "page": 1, "next": "http://next"}).encode()
+
+        self.assertEqual(([{"a": 1.5, "b": [[1], [2]]}, {"a": False}], {"size": 2, "next": "http://next"}),
+                         parse_projected(body, "values.item", ["a", "b"], ["size", "next"]))
+
+    def test_parse_projected_empty(self):
+        self.assertEqual(([], {}), parse_projected(b'{"values": []}', "values.item", ["a"], ["next"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import logging
+import random
+
+from flask import current_app
+
+
+SAMPLE_RATE = 0.1
+
+
+def log_upstream_call(provider, url, logger=None, config=None, **fields):
+    """
+    Logs an upstream call at debug level for a sample of calls, the "upstream_log_sample_rate" app config (a fraction
+    between 0 and 1). Nothing is formatted unless debug logging is enabled and the call is sampled. The provider, url
+    and any other fields are passed as structured fields of the record as well as in its message.
+
+    The async clients, which have no application context, pass their logger and config.
+    """
+    logger = logger or current_app.logger
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    sample_rate = (config if config is not None else current_app.config).get("upstream_log_sample_rate", SAMPLE_RATE)
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+
+    fields = {"provider": provider, "url": url, **fields}
+    logger.debug(" ".join(f"{name}=%s" for name in fields), *fields.values(), extra={"upstream": fields})
+
+
+def log_trace_summary(name, upstream, elapsed_s, logger=None):
+    """
+    Logs the pages, calls, bytes and time of the upstream calls made for one profile, along with its end to end time
+    """
+    logger = logger or current_app.logger
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    summary = {"name": name, **upstream.summary(), "ms": round(elapsed_s * 1000)}
+    logger.info("profile " + " ".join(f"{field}=%s" for field in summary), *summary.values(),
+                extra={"trace": summary})
@@ -0,0 +1,63 @@
+import logging
+import unittest
+
+import flask
+
+from app.logs import log_trace_summary, log_upstream_call
+from app.metrics import Trace
+
+
+app = flask.Flask(__name__)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class LogsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        app.logger.setLevel(logging.DEBUG)
+        app.config["upstream_log_sample_rate"] = 1
+
+    def test_log_upstream_call(self):
+        with app.app_context(), self.assertLogs(app.logger, logging.DEBUG) as logs:
+            log_upstream_call("github", "http://dummy-url", cursor="abc")
+
+        self.assertEqual(["provider=github url=http://dummy-url cursor=abc"], [r.getMessage() for r in logs.records])
+        self.assertEqual({"provider": "github", "url": "http://dummy-url", "cursor": "abc"}, logs.records[0].upstream)
+
+    def test_log_upstream_call_gated(self):
+        logger = logging.getLogger("logs_test")
+        logger.setLevel(logging.INFO)
+        handler = ListHandler()
+        logger.addHandler(handler)
+
+        log_upstream_call("github", "http://dummy-url", logger=logger, config={"upstream_log_sample_rate": 1})
+        self.assertEqual([], handler.records)
+
+    def test_log_upstream_call_sampled(self):
+        app.config["upstream_log_sample_rate"] = 0
+        with app.app_context(), self.assertNoLogs(app.logger, logging.DEBUG):
+            log_upstream_call("github", "http://dummy-url")
+
+    def test_log_trace_summary(self):
+        upstream = Trace()
+        upstream.record_call("repos", 0.25, 1000)
+        upstream.record_call("watchers", 0.25, 24)
+
+        with app.app_context(), self.assertLogs(app.logger, logging.INFO) as logs:
+            log_trace_summary("org-1", upstream, 0.3)
+
+        self.assertEqual(["profile name=org-1 pages=1 calls=2 bytes=1024 upstream_ms=500 ms=300"],
+                         [r.getMessage() for r in logs.records])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+import contextvars
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_registry = []
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Counter(object):
+    """
+    A thread safe, monotonically increasing count per combination of label values
+    """
+    kind = "counter"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(zip(self.label_names, key)), value) for key, value in sorted(self._values.items())]
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+
+class Histogram(Counter):
+    """
+    A thread safe distribution of observed values per combination of label values, counted into cumulative buckets
+    """
+    kind = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS_S):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, then the count and sum of all observations
+                counts = self._values[key] = [0] * len(self.buckets) + [0, 0]
+            for i, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the seconds taken by the body of the with statement
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels):
+        """
+        Returns the number of observations
+        """
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return counts[-2] if counts else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                labels = dict(zip(self.label_names, key))
+                for bucket, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", {**labels, "le": _format(bucket)}, count))
+                samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, counts[-2]))
+                samples.append((f"{self.name}_sum", labels, counts[-1]))
+                samples.append((f"{self.name}_count", labels, counts[-2]))
+
+        return samples
+
+
+class Trace(object):
+    """
+    The upstream calls made on behalf of one profile, counted by endpoint across every thread working on it along with
+    the bytes they returned and the seconds they took
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self.calls = Tally()
+        self.bytes = 0
+        self.seconds = 0
+
+    def record_call(self, endpoint, seconds=0, nbytes=0):
+        with self._lock:
+            self.calls[endpoint] += 1
+            self.seconds += seconds
+            self.bytes += nbytes
+        if self.parent is not None:
+            self.parent.record_call(endpoint, seconds, nbytes)
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def summary(self):
+        with self._lock:
+            return {
+                "pages": self.calls["repos"],
+                "calls": sum(self.calls.values()),
+                "bytes": self.bytes,
+                "upstream_ms": round(self.seconds * 1000),
+            }
+
+
+class UpstreamCall(object):
+    """
+    Yielded by upstream_call for the caller to report the size of the response body
+    """
+
+    def __init__(self):
+        self.bytes = 0
+
+
+upstream_latency = Histogram("upstream_request_duration_seconds",
+                             "Latency of upstream calls, including any wait for the rate limit",
+                             ("provider", "endpoint"))
+upstream_retries = Counter("upstream_retries_total", "Upstream requests retried, by reason", ("reason",))
+upstream_hedges = Counter("upstream_hedges_total", "Slow upstream requests sent again, by which request answered first",
+                          ("provider", "endpoint", "winner"))
+upstream_cancelled = Counter("upstream_cancelled_total",
+                             "Upstream calls skipped because their result was no longer wanted")
+profile_pages = Histogram("profile_pages", "Upstream repository pages fetched per provider profile", ("provider",),
+                          buckets=PAGE_BUCKETS)
+profile_deadline_misses = Counter("profile_deadline_misses_total",
+                                  "Providers left out of a profile for missing its deadline", ("provider",))
+profile_latency = Histogram("profile_request_duration_seconds", "End to end latency of /v1/profile requests")
+
+
+@contextmanager
+def trace():
+    """
+    Starts counting the upstream calls made on behalf of a profile, yielding the Trace they are counted in. Worker
+    threads started with workers.with_app_context count into the trace of the thread that started them, and calls are
+    also counted in any enclosing trace.
+    """
+    upstream = Trace(parent=_trace.get())
+    token = _trace.set(upstream)
+    try:
+        yield upstream
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def upstream_call(provider, endpoint):
+    """
+    Times the upstream call made in the body of the with statement, counting it in the current trace if there is one.
+    The endpoint is the kind of resource called, such as "repos" for repository pages or "watchers", and the yielded
+    UpstreamCall takes the size of the response.
+    """
+    call = UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        seconds = time.perf_counter() - start
+        upstream_latency.observe(seconds, provider=provider, endpoint=endpoint)
+        upstream = _trace.get()
+        if upstream is not None:
+            upstream.record_call(endpoint, seconds, call.bytes)
+
+
+def render(extra=()):
+    """
+    Renders every metric in the Prometheus text exposition format, followed by any extra (name, description, kind,
+    value) tuples of values that are tracked elsewhere, such as the cache statistics
+    """
+    lines = []
+    for metric in _registry:
+        lines += [f"# HELP {metric.name} {metric.description}", f"# TYPE {metric.name} {metric.kind}"]
+        lines += [_sample(name, labels, value) for name, labels, value in metric.samples()]
+
+    for name, description, kind, value in extra:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", _sample(name, {}, value)]
+
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in _registry:
+        metric.reset()
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return f"{name} {_format(value)}"
+
+    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return f"{name}{{{label_text}}} {_format(value)}"
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -0,0 +1,59 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import flask
+
+from app.metrics import Counter, Histogram, render, trace, upstream_call
+from app.workers import with_app_context
+
+
+app = flask.Flask(__name__)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_counter(self):
+        retries = Counter("test_retries_total", "Retries", ("reason",))
+        retries.inc(reason="error")
+        retries.inc(2, reason="error")
+
+        self.assertEqual(3, retries.value(reason="error"))
+        self.assertEqual(0, retries.value(reason="rate_limited"))
+        self.assertEqual([("test_retries_total", {"reason": "error"}, 3)], retries.samples())
+
+    def test_histogram(self):
+        latency = Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1))
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        self.assertEqual(3, latency.value())
+        self.assertIn("\n".join([
+            "# TYPE test_latency_seconds histogram",
+            'test_latency_seconds_bucket{le="0.1"} 1',
+            'test_latency_seconds_bucket{le="1"} 2',
+            'test_latency_seconds_bucket{le="+Inf"} 3',
+            "test_latency_seconds_sum 5.55",
+            "test_latency_seconds_count 3",
+        ]), render())
+
+    def test_render_extra(self):
+        self.assertIn("# TYPE test_entries gauge\ntest_entries 4\n",
+                      render([("test_entries", "Entries", "gauge", 4)]))
+
+    def test_trace_counts_worker_calls(self):
+        def call(endpoint):
+            with upstream_call("test", endpoint):
+                pass
+
+        with app.app_context(), trace() as upstream:
+            call("repos")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(with_app_context(call), ["watchers"] * 3))
+
+        call("repos")
+        self.assertEqual({"repos": 1, "watchers": 3}, upstream.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
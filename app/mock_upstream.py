@@ -0,0 +1,180 @@
+import asyncio
+import random
+import socket
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from aiohttp import web
+
+
+LANGUAGES = ("Python", "Javascript", "Go", "Java", None)
+TOPICS = ("api", "cli", "web", "data", "ops")
+
+
+class MockUpstream(object):
+    """
+    A local stand-in for Github (REST and GraphQL) and Bitbucket, serving generated organizations/teams of
+    repos_per_org repositories each so the service can be load tested without the real APIs.
+
+    Github's repositories are paginated with Link headers, at most github_page_size per page, and Bitbucket's with
+    "next" links, at most bitbucket_page_size per page. Each Bitbucket repository has watchers_per_repo watchers
+    paginated watcher_page_size per page; with watcher_size the watcher pages carry a "size" so one call per repository
+    suffices, otherwise every watcher page must be fetched. Every response is delayed by latency_s, and a random
+    tail_ratio of them by a further tail_latency_s, to model a slow upstream node.
+
+    The calls received are counted by endpoint in calls.
+    """
+
+    def __init__(self, repos_per_org=250, github_page_size=100, bitbucket_page_size=100, watchers_per_repo=5,
+                 watcher_page_size=10, watcher_size=True, latency_s=0.02, tail_ratio=0, tail_latency_s=0):
+        self.repos_per_org = repos_per_org
+        self.github_page_size = github_page_size
+        self.bitbucket_page_size = bitbucket_page_size
+        self.watchers_per_repo = watchers_per_repo
+        self.watcher_page_size = watcher_page_size
+        self.watcher_size = watcher_size
+        self.latency_s = latency_s
+        self.tail_ratio = tail_ratio
+        self.tail_latency_s = tail_latency_s
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get("/github/orgs/{org}/repos", self.github_repos)
+        app.router.add_post("/github/graphql", self.github_graphql)
+        app.router.add_get("/bitbucket/2.0/repositories/{org}", self.bitbucket_repos)
+        app.router.add_get("/bitbucket/2.0/repositories/{org}/{repo}/watchers", self.bitbucket_watchers)
+        return app
+
+    @contextmanager
+    def serve(self):
+        """
+        Serves the stand-in from a background thread, yielding its base url (the Github API is under /github and the
+        Bitbucket API under /bitbucket/2.0)
+        """
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(self.create_app(), access_log=None)
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.SockSite(runner, sock, backlog=1024).start())
+        thread = threading.Thread(target=loop.run_forever, name="mock-upstream", daemon=True)
+        thread.start()
+        try:
+            yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+        finally:
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    async def github_repos(self, request):
+        await self._called("github_repos")
+        page = int(request.query.get("page", 1))
+        page_size = min(int(request.query.get("per_page", 30)), self.github_page_size)
+        last_page = max(1, -(-self.repos_per_org // page_size))
+        start = (page - 1) * page_size
+        repos = [self.github_repo(request.match_info["org"], i)
+                 for i in range(start, min(start + page_size, self.repos_per_org))]
+
+        links = []
+        if page < last_page:
+            links.append(f'<{request.url.update_query(page=page + 1)}>; rel="next"')
+            links.append(f'<{request.url.update_query(page=last_page)}>; rel="last"')
+        return web.json_response(repos, headers={"Link": ", ".join(links)} if links else None)
+
+    async def github_graphql(self, request):
+        await self._called("github_graphql")
+        variables = (await request.json())["variables"]
+        start = int(variables["cursor"] or 0)
+        end = min(start + min(variables["pageSize"], self.github_page_size), self.repos_per_org)
+        nodes = [self.github_repo_node(variables["organization"], i) for i in range(start, end)]
+        repositories = {"pageInfo": {"hasNextPage": end < self.repos_per_org, "endCursor": str(end)}, "nodes": nodes}
+        rate_limit = {"remaining": 5000, "resetAt": "2100-01-01T00:00:00Z"}
+        return web.json_response({"data": {"rateLimit": rate_limit, "organization": {"repositories": repositories}}})
+
+    async def bitbucket_repos(self, request):
+        await self._called("bitbucket_repos")
+        org = request.match_info["org"]
+        page = int(request.query.get("page", 1))
+        page_size = min(int(request.query.get("pagelen", 10)), self.bitbucket_page_size)
+        start = (page - 1) * page_size
+        end = min(start + page_size, self.repos_per_org)
+        values = [self.bitbucket_repo(request, org, i) for i in range(start, end)]
+
+        body = {"size": self.repos_per_org, "values": values}
+        if start + page_size < self.repos_per_org:
+            body["next"] = str(request.url.update_query(page=page + 1))
+        return web.json_response(body)
+
+    async def bitbucket_watchers(self, request):
+        await self._called("bitbucket_watchers")
+        page = int(request.query.get("page", 1))
+        page_size = min(int(request.query.get("pagelen", 10)), self.watcher_page_size)
+        start = (page - 1) * page_size
+        values = [{"uuid": f"{{watcher-{i}}}"} for i in range(start, min(start + page_size, self.watchers_per_repo))]
+
+        body = {"values": values}
+        if self.watcher_size:
+            body["size"] = self.watchers_per_repo
+        if start + page_size < self.watchers_per_repo:
+            body["next"] = str(request.url.update_query(page=page + 1))
+        return web.json_response(body)
+
+    def github_repo(self, org, i):
+        return {
+            "id": i,
+            "name": f"{org}-repo-{i}",
+            "full_name": f"{org}/{org}-repo-{i}",
+            "private": i % 10 == 9,
+            "fork": i % 4 == 3,
+            "language": LANGUAGES[i % len(LANGUAGES)],
+            "watchers_count": i % 50,
+            "stargazers_count": i % 50,
+            "subscribers_count": i % 7,
+            "topics": list(TOPICS[:i % len(TOPICS)]),
+            "updated_at": "2020-01-01T00:00:00Z",
+            "description": "A generated repository " * 4,
+        }
+
+    def github_repo_node(self, org, i):
+        repo = self.github_repo(org, i)
+        return {
+            "databaseId": repo["id"],
+            "updatedAt": repo["updated_at"],
+            "isPrivate": repo["private"],
+            "isFork": repo["fork"],
+            "primaryLanguage": {"name": repo["language"]} if repo["language"] else None,
+            "stargazerCount": repo["stargazers_count"],
+            "watchers": {"totalCount": repo["subscribers_count"]},
+            "repositoryTopics": {"nodes": [{"topic": {"name": topic}} for topic in repo["topics"]]},
+        }
+
+    def bitbucket_repo(self, request, org, i):
+        repo = {
+            "uuid": f"{{repo-{i}}}",
+            "full_name": f"{org}/repo-{i}",
+            "is_private": i % 10 == 9,
+            "language": (LANGUAGES[i % len(LANGUAGES)] or "").lower(),
+            "links": {"watchers": {"href": str(request.url.with_path(
+                f"/bitbucket/2.0/repositories/{org}/repo-{i}/watchers").with_query(None))}},
+            "description": "A generated repository " * 4,
+        }
+        if i % 4 == 3:
+            repo["parent"] = {"full_name": f"upstream/repo-{i}"}
+        return repo
+
+    async def _called(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+        latency_s = self.latency_s
+        if self.tail_ratio and random.random() < self.tail_ratio:
+            latency_s += self.tail_latency_s
+        if latency_s:
+            await asyncio.sleep(latency_s)
@@ -1,41 +1,499 @@
+import contextvars
+import functools
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
 import requests
 from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from requests.packages.urllib3.util.retry import Retry
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from app import metrics
+from app.cache import TTLCache
 
 
 DEFAULT_TIMEOUT_S = 5
 RETRIES = 3
 BACKOFF = 0.2
 RETRY_STATUSES = [500, 502, 504]
+MAX_REQUESTS_PER_HOST = 10
+POOL_SIZE = 20
+KEEP_ALIVE = True
+MAX_VALIDATED_RESPONSES = 10000
+RATE_LIMIT_RETRIES = 3
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+MAX_HEDGE_RATIO = 0.1
+MAX_HEDGE_BURST = 10
+HEDGE_WORKERS = 32
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+_max_requests_per_host = MAX_REQUESTS_PER_HOST
+
+_session = None
+_session_lock = threading.Lock()
+_hedge_executor = None
+_hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+_pool_size = POOL_SIZE
+_keep_alive = KEEP_ALIVE
+
+_validated_responses = TTLCache(ttl_s=None, max_entries=MAX_VALIDATED_RESPONSES)
+
+_hedge_percentile = None
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+_cancelled = contextvars.ContextVar("cancelled", default=None)
+
+
+class ConnectionStats(object):
+    """
+    Thread safe counters of the connections checked out of the connection pools, split by newly opened and reused
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.opened = 0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.opened = 0
+
+    def asdict(self):
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "reused": max(self.checkouts - self.opened, 0),
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+
+    def _new_conn(self):
+        connection_stats.record_opened()
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        connection_stats.record_checkout()
+        return super()._get_conn(timeout=timeout)
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+
+    def _new_conn(self):
+        connection_stats.record_opened()
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        connection_stats.record_checkout()
+        return super()._get_conn(timeout=timeout)
+
+
+class LatencyTracker(object):
+    """
+    Thread safe window of the latencies of the window most recent upstream calls of one kind, along with the number of
+    calls and of hedged calls so far.
+
+    Hedges are paid for from a token bucket: each call earns max_ratio of a hedge, and at most max_burst hedges can be
+    saved up. So over any stretch of calls at most max_ratio of them (plus the burst) are hedged, however many calls
+    went unhedged before.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, max_ratio=MAX_HEDGE_RATIO, max_burst=MAX_HEDGE_BURST):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.max_ratio = max_ratio
+        self.max_burst = max_burst
+        self._budget = 0
+        self.calls = 0
+        self.hedges = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+            # the budget is kept in calls, a hedge costing 1 / max_ratio of them, so it adds up exactly
+            self._budget = min(self._budget + 1, self.max_burst / self.max_ratio)
+            self.calls += 1
+
+    def percentile(self, p, min_samples=MIN_LATENCY_SAMPLES):
+        """
+        Returns the nearest rank p-th percentile (0 to 100) of the recent latencies, or None if there are fewer than
+        min_samples of them
+        """
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            ordered = sorted(self._latencies)
+
+        return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+    def try_hedge(self):
+        """
+        Returns whether the budget allows another call to be hedged, spending a hedge from it if so
+        """
+        with self._lock:
+            if self._budget < 1 / self.max_ratio:
+                return False
+            self._budget -= 1 / self.max_ratio
+            self.hedges += 1
+            return True
+
+
+class Cancelled(requests.exceptions.RequestException):
+    """
+    Raised in place of an upstream call whose result is no longer wanted, see cancellable
+    """
+
+
+def configure(max_requests_per_host=MAX_REQUESTS_PER_HOST, pool_size=POOL_SIZE, keep_alive=KEEP_ALIVE,
+              hedge_percentile=None, response_cache=None):
+    """
+    Configures the process wide network settings, should be called before any requests are made.
+
+    With a hedge_percentile (0 to 100), a call that has taken longer than that percentile of the recent calls of the
+    same kind is hedged, see conditional_get. The validated responses conditional_get revalidates are kept in
+    response_cache (such as a shared_cache.SharedCache, so worker processes revalidate each other's responses), by
+    default in a new in-process TTLCache. The shared session is discarded so the next call to get_session picks up the
+    new settings.
+    """
+    global _max_requests_per_host, _pool_size, _keep_alive, _hedge_percentile, _validated_responses
+    with _host_semaphores_lock:
+        _max_requests_per_host = max_requests_per_host
+        _host_semaphores.clear()
+
+    with _latencies_lock:
+        _hedge_percentile = hedge_percentile
+        _latencies.clear()
+
+    if response_cache is None:
+        response_cache = TTLCache(ttl_s=None, max_entries=MAX_VALIDATED_RESPONSES)
+    _validated_responses = response_cache
+
+    with _session_lock:
+        _pool_size = pool_size
+        _keep_alive = keep_alive
+    reset_session()
+
+
+def host_semaphore(url):
+    """
+    Returns the semaphore that bounds the number of concurrent requests to the host of the given url
+    """
+    host = urlsplit(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(_max_requests_per_host)
+
+        return _host_semaphores[host]
+
+
+def latency_tracker(hedge_key):
+    """
+    Returns the tracker of the recent latencies of the upstream calls of the given kind, such as ("github", "repos")
+    """
+    with _latencies_lock:
+        if hedge_key not in _latencies:
+            _latencies[hedge_key] = LatencyTracker()
+
+        return _latencies[hedge_key]
+
+
+def cancellable(fn, event):
+    """
+    Wraps fn so that once the event is set, upstream calls made by it (and by worker threads it starts with
+    workers.with_app_context) raise Cancelled instead of being sent, such as the remaining pages of a listing nobody is
+    waiting for anymore. A request already on the wire is not interrupted.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _cancelled.set(event)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _cancelled.reset(token)
+
+    return wrapper
+
+
+def check_cancelled():
+    """
+    Raises Cancelled if the work being done has been cancelled, see cancellable
+    """
+    event = _cancelled.get()
+    if event is not None and event.is_set():
+        metrics.upstream_cancelled.inc()
+        raise Cancelled("The upstream call is no longer wanted")
+
+
+class CountingRetry(Retry):
+    """
+    A urllib3 retry policy that counts each retry in the upstream_retries_total metric. The increment that exhausts the
+    policy raises MaxRetryError instead of retrying, so it is not counted.
+    """
+
+    def increment(self, *args, **kwargs):
+        retry = super().increment(*args, **kwargs)
+        if not retry.is_exhausted():
+            metrics.upstream_retries.inc(reason="error")
+        return retry
 
 
 class TimeoutAdapter(HTTPAdapter):
     """
-    An adapter that supplies a default timeout if one is not provided
+    An adapter that supplies a default timeout if one is not provided and limits the concurrent requests per host.
+
+    Its connection pools count how many connections are opened versus reused, see connection_stats.
     """
 
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
     def send(self, request, **kwargs):
         if "timeout" not in kwargs:
             kwargs["timeout"] = DEFAULT_TIMEOUT_S
-        return super().send(request, **kwargs)
+        with host_semaphore(request.url):
+            return super().send(request, **kwargs)
 
 
 def get_session():
     """
-    Returns a requests session with retry and timeout logic configured for all requests
+    Returns the process wide requests session with retry and timeout logic configured for all requests.
+
+    The session is created on first use and shared by all threads, so its pooled connections are kept alive and reused
+    across calls instead of paying a new TCP and TLS handshake per request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _new_session(_pool_size, _keep_alive)
+
+        return _session
+
+
+def reset_session():
+    """
+    Closes the shared session and its pooled connections and shuts down the pool hedged requests are sent from, the next
+    call to get_session (or hedged request) creates new ones. Also serves to discard those inherited after fork.
+    """
+    global _session, _hedge_executor
+    with _session_lock:
+        session, _session = _session, None
+        executor, _hedge_executor = _hedge_executor, None
+
+    if session is not None:
+        session.close()
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def hedge_executor():
+    """
+    Returns the process wide pool of HEDGE_WORKERS threads hedged requests are sent from
     """
+    global _hedge_executor
+    with _session_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedged-request")
+
+        return _hedge_executor
+
+
+def _new_session(pool_size, keep_alive):
     http = requests.Session()
+    if not keep_alive:
+        http.headers["Connection"] = "close"
 
-    retry = Retry(
+    # rate limited responses are retried by the rate limiter passed to conditional_get, not by urllib3
+    retry = CountingRetry(
         total=RETRIES,
         read=RETRIES,
         connect=RETRIES,
         backoff_factor=BACKOFF,
         status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=False,
     )
-    adapter = TimeoutAdapter(max_retries=retry)
+    adapter = TimeoutAdapter(max_retries=retry, pool_maxsize=pool_size)
     http.mount("http://", adapter)
     http.mount("https://", adapter)
 
     return http
 
+
+def conditional_get(url, headers=None, params=None, limiter=None, hedge_key=None, credentials=None):
+    """
+    Makes a GET request with the shared session, sending the validators (ETag/Last-Modified) of the last successful
+    response for the same url. A 304 Not Modified is answered with a copy of that stored response, so an unchanged
+    resource costs no bandwidth (and for Github, no rate limit). The validators are kept per url rather than per
+    credential, since the credential does not change the representation a validator identifies.
+
+    If a rate limiter is given the request is scheduled by it, and a response rejected for exceeding the rate limit is
+    retried once the limit resets. Alternatively credentials is a callable returning the (headers, limiter) of the
+    credential to make each attempt with (such as rate_limit.next_credentials), so a rejected request is retried with
+    whichever credential then has the most quota rather than waiting for the one that was rejected.
+
+    If a hedge_key naming the kind of call is given, such as ("bitbucket", "watchers"), and a hedge percentile is
+    configured, a request still unanswered after that percentile of the recent latencies of the same kind is sent again
+    and whichever answers first is used. Hedges are budgeted to MAX_HEDGE_RATIO of the calls of a kind (see
+    LatencyTracker), so a slow upstream sees a bounded amount of extra load, and take a request from the rate limiter
+    like any other, so a duplicate is only sent while the limit has room for it. The requests are sent from a pool of
+    HEDGE_WORKERS threads, while it is busy calls are made directly without a hedge. Raises Cancelled if the work has
+    been cancelled, see cancellable.
+    """
+    headers = dict(headers or {})
+    key = requests.Request("GET", url, params=params).prepare().url
+
+    stored = _validated_responses.get(key)
+    if stored is not None:
+        etag, last_modified = stored[:2]
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+    def send(attempt_headers, attempt_limiter):
+        get = functools.partial(get_session().get, url, headers=attempt_headers, params=params)
+        return get() if hedge_key is None else _send_hedged(get, hedge_key, attempt_limiter)
+
+    r = _send_limited(send, headers, limiter, credentials)
+
+    if r.status_code == 304 and stored is not None:
+        return _stored_response(key, stored)
+
+    if r.ok and ("ETag" in r.headers or "Last-Modified" in r.headers):
+        _validated_responses.put(
+            key, (r.headers.get("ETag"), r.headers.get("Last-Modified"), r.status_code, dict(r.headers), r.content)
+        )
+
+    return r
+
+
+def _stored_response(url, stored):
+    """
+    Rebuilds the response a 304 Not Modified stands for from what conditional_get stored of it. Only the validators,
+    status, headers and body are stored, not the response itself, since that carries the request it answered along with
+    its Authorization header, and the response cache may be shared with other processes.
+    """
+    _, _, status, headers, content = stored
+    r = requests.Response()
+    r.status_code = status
+    r.headers = CaseInsensitiveDict(headers)
+    r._content = content
+    r.url = url
+    r.encoding = get_encoding_from_headers(r.headers)
+    return r
+
+
+def limited_post(url, json=None, headers=None, limiter=None, credentials=None):
+    """
+    Makes a POST request with the shared session, such as a GraphQL query. If a rate limiter is given the request is
+    scheduled by it, and a response rejected for exceeding the rate limit is retried once the limit resets. credentials
+    chooses the credential of each attempt as for conditional_get.
+    """
+    return _send_limited(lambda attempt_headers, _: get_session().post(url, json=json, headers=attempt_headers),
+                         dict(headers or {}), limiter, credentials)
+
+
+def _send_limited(send, headers, limiter, credentials):
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        check_cancelled()
+        attempt_headers = headers
+        if credentials is not None:
+            credential_headers, limiter = credentials()
+            attempt_headers = {**headers, **credential_headers}
+        if limiter is not None:
+            limiter.acquire()
+            check_cancelled()
+
+        r = send(attempt_headers, limiter)
+        if limiter is None or not limiter.update(r) or attempt == RATE_LIMIT_RETRIES:
+            return r
+
+        metrics.upstream_retries.inc(reason="rate_limited")
+
+
+def _send_hedged(send, hedge_key, limiter):
+    tracker = latency_tracker(hedge_key)
+    delay = None if _hedge_percentile is None else tracker.percentile(_hedge_percentile)
+    primary = None if delay is None else _start(send, tracker)
+    if primary is None:
+        return _timed(send, tracker)
+
+    if not wait([primary], timeout=delay).done and tracker.try_hedge():
+        check_cancelled()
+        hedge = _start(send, tracker, limiter)
+        if hedge is not None:
+            return _first_answer({primary: "primary", hedge: "hedge"}, hedge_key)
+
+    return primary.result()
+
+
+def _first_answer(names, hedge_key):
+    pending = set(names)
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        answered = [future for future in done if future.exception() is None]
+        if answered or not pending:
+            winner = (answered or list(done))[0]
+            provider, endpoint = hedge_key
+            metrics.upstream_hedges.inc(provider=provider, endpoint=endpoint, winner=names[winner])
+            # the slower request cannot be aborted, its response is closed to release its connection once it arrives
+            for loser in pending | (done - {winner}):
+                loser.add_done_callback(_close_response)
+            return winner.result()
+
+
+def _start(send, tracker, limiter=None):
+    """
+    Sends the request from the hedging pool, returning its future, or None without sending it if every worker is busy
+    or the rate limiter has no request to spare right away
+    """
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    if limiter is not None and not limiter.try_acquire():
+        _hedge_slots.release()
+        return None
+
+    try:
+        future = hedge_executor().submit(_timed, send, tracker)
+    except BaseException:
+        _hedge_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def _timed(send, tracker):
+    start = time.perf_counter()
+    r = send()
+    tracker.record(time.perf_counter() - start)
+    return r
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
@@ -0,0 +1,175 @@
+import pickle
+import threading
+import unittest
+
+import responses
+from urllib3.exceptions import MaxRetryError
+
+from app import metrics, net
+from app.rate_limit import RateLimiter
+
+
+class NetTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        net.configure()
+        net.connection_stats.reset()
+
+    def test_get_session_shared(self):
+        self.assertIs(net.get_session(), net.get_session())
+
+    def test_configure_replaces_session(self):
+        session = net.get_session()
+        net.configure(pool_size=2, keep_alive=False)
+
+        self.assertIsNot(session, net.get_session())
+        self.assertEqual("close", net.get_session().headers["Connection"])
+        self.assertEqual(2, net.get_session().get_adapter("https://example.com")._pool_maxsize)
+
+    def test_connection_stats(self):
+        net.connection_stats.reset()
+        pool = net.CountingHTTPConnectionPool("localhost", 8080, maxsize=1)
+
+        connection = pool._get_conn()
+        pool._put_conn(connection)
+        pool._get_conn()
+
+        self.assertEqual({"opened": 1, "reused": 1}, net.connection_stats.asdict())
+
+    def test_counting_retry_counts_retries_only(self):
+        metrics.upstream_retries.reset()
+        retry = net.CountingRetry(total=1).increment(method="GET", url="/")
+
+        with self.assertRaises(MaxRetryError):
+            retry.increment(method="GET", url="/")
+        self.assertEqual(1, metrics.upstream_retries.value(reason="error"))
+
+    def test_host_semaphore(self):
+        net.configure(max_requests_per_host=2)
+
+        self.assertIs(net.host_semaphore("https://example.com/a"), net.host_semaphore("https://example.com/b"))
+        self.assertIsNot(net.host_semaphore("https://example.com/a"), net.host_semaphore("https://example.org/a"))
+
+    @responses.activate
+    def test_conditional_get(self):
+        responses.add(responses.GET, "http://dummy-url/etag", json={"unit-test": "data"}, status=200,
+                      headers={"ETag": '"abc"'})
+        responses.add(responses.GET, "http://dummy-url/etag", status=304)
+
+        self.assertEqual({"unit-test": "data"}, net.conditional_get("http://dummy-url/etag").json())
+        self.assertEqual({"unit-test": "data"}, net.conditional_get("http://dummy-url/etag").json())
+        self.assertNotIn("If-None-Match", responses.calls[0].request.headers)
+        self.assertEqual('"abc"', responses.calls[1].request.headers["If-None-Match"])
+
+    @responses.activate
+    def test_conditional_get_across_credentials(self):
+        responses.add(responses.GET, "http://dummy-url/auth", json={}, status=200,
+                      headers={"Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+
+        net.conditional_get("http://dummy-url/auth", headers={"Authorization": "token a"})
+        r = net.conditional_get("http://dummy-url/auth", headers={"Authorization": "token b"})
+        self.assertEqual("Wed, 21 Oct 2015 07:28:00 GMT", responses.calls[1].request.headers["If-Modified-Since"])
+        self.assertEqual({}, r.json())
+        # the stored response does not carry the token it was fetched with
+        self.assertNotIn(b"token", pickle.dumps(net._validated_responses.get("http://dummy-url/auth")))
+
+    def test_latency_tracker(self):
+        tracker = net.LatencyTracker(window=100)
+        self.assertIsNone(tracker.percentile(95, min_samples=1))
+
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+
+        self.assertEqual(0.095, tracker.percentile(95))
+        self.assertEqual(0.05, tracker.percentile(50))
+        self.assertEqual([True] * 10 + [False], [tracker.try_hedge() for _ in range(11)])
+
+    def test_latency_tracker_hedge_budget(self):
+        tracker = net.LatencyTracker(max_ratio=0.1, max_burst=2)
+        for _ in range(1000):
+            tracker.record(0.01)
+
+        # a long unhedged stretch only saves up the burst
+        self.assertEqual([True, True, False], [tracker.try_hedge() for _ in range(3)])
+        for _ in range(10):
+            tracker.record(0.01)
+        self.assertEqual([True, False], [tracker.try_hedge() for _ in range(2)])
+
+    @responses.activate
+    def test_conditional_get_hedged(self):
+        metrics.reset()
+        net.configure(hedge_percentile=90)
+        for _ in range(net.MIN_LATENCY_SAMPLES):
+            net.latency_tracker(("bitbucket", "watchers")).record(0.01)
+        calls = []
+        release = threading.Event()
+        primary_done = threading.Event()
+
+        def respond(request):
+            calls.append(request)
+            if len(calls) == 1:
+                release.wait(5)
+                primary_done.set()
+                return 200, {}, '{"request": "primary"}'
+            return 200, {}, '{"request": "hedge"}'
+
+        responses.add_callback(responses.GET, "http://dummy-url/slow", callback=respond)
+
+        r = net.conditional_get("http://dummy-url/slow", hedge_key=("bitbucket", "watchers"))
+        release.set()
+        primary_done.wait(5)
+
+        self.assertEqual({"request": "hedge"}, r.json())
+        self.assertEqual(2, len(calls))
+        self.assertEqual(1, metrics.upstream_hedges.value(provider="bitbucket", endpoint="watchers", winner="hedge"))
+
+    @responses.activate
+    def test_conditional_get_hedge_rate_limited(self):
+        metrics.reset()
+        net.configure(hedge_percentile=90)
+        for _ in range(net.MIN_LATENCY_SAMPLES):
+            net.latency_tracker(("github", "repos")).record(0.01)
+        calls = []
+
+        def respond(request):
+            calls.append(request)
+            threading.Event().wait(0.2)
+            return 200, {}, '{"request": "primary"}'
+
+        responses.add_callback(responses.GET, "http://dummy-url/limited", callback=respond)
+
+        # the primary takes the only request the limiter has, so no hedge is sent
+        limiter = RateLimiter(rate_per_s=0.001)
+        r = net.conditional_get("http://dummy-url/limited", limiter=limiter, hedge_key=("github", "repos"))
+
+        self.assertEqual({"request": "primary"}, r.json())
+        self.assertEqual(1, len(calls))
+        self.assertEqual(0, metrics.upstream_hedges.value(provider="github", endpoint="repos", winner="hedge"))
+
+    @responses.activate
+    def test_conditional_get_not_hedged_without_history(self):
+        net.configure(hedge_percentile=90)
+        responses.add(responses.GET, "http://dummy-url/new", json={}, status=200)
+
+        net.conditional_get("http://dummy-url/new", hedge_key=("github", "repos"))
+
+        self.assertEqual(1, len(responses.calls))
+        self.assertEqual(1, net.latency_tracker(("github", "repos")).calls)
+
+    @responses.activate
+    def test_cancellable(self):
+        cancel = threading.Event()
+        get = net.cancellable(net.conditional_get, cancel)
+        responses.add(responses.GET, "http://dummy-url/cancel", json={}, status=200)
+
+        self.assertEqual(200, get("http://dummy-url/cancel").status_code)
+        cancel.set()
+        with self.assertRaises(net.Cancelled):
+            get("http://dummy-url/cancel")
+        self.assertEqual(1, len(responses.calls))
+        # outside of the cancelled work calls are unaffected
+        self.assertEqual(200, net.conditional_get("http://dummy-url/cancel").status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import threading
+import time
+
+from flask import current_app
+
+from app.cache import get_summary_cache
+from app.metrics import trace
+from app.profiles import PROVIDERS, refresh_summary
+
+
+HALF_LIFE_S = 10 * 60
+# roughly, requested more than once in the last half life
+MIN_SCORE = 1.5
+MAX_TRACKED = 10000
+HOT_ORGS = 50
+INTERVAL_S = 10
+
+_extension_lock = threading.Lock()
+
+
+class HotOrgs(object):
+    """
+    Thread safe, exponentially decayed request counts per organization/team name. A request counts for half as much
+    after every half_life_s seconds, so the scores favour names requested often and recently.
+
+    At most max_tracked names are tracked, once there are more the coldest half is forgotten.
+    """
+
+    def __init__(self, half_life_s=HALF_LIFE_S, max_tracked=MAX_TRACKED, clock=time.monotonic):
+        self.half_life_s = half_life_s
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._scores = {}
+
+    def record(self, entity_name):
+        now = self._clock()
+        with self._lock:
+            self._scores[entity_name] = (self._decayed(entity_name, now) + 1, now)
+            if len(self._scores) > self.max_tracked:
+                coldest = sorted(self._scores, key=lambda name: self._decayed(name, now))
+                for name in coldest[:len(coldest) // 2]:
+                    del self._scores[name]
+
+    def score(self, entity_name):
+        with self._lock:
+            return self._decayed(entity_name, self._clock())
+
+    def hottest(self, n, min_score=MIN_SCORE):
+        """
+        Returns up to n names scoring at least min_score, hottest first
+        """
+        now = self._clock()
+        with self._lock:
+            scores = [(self._decayed(name, now), name) for name in self._scores]
+
+        return [name for score, name in sorted(scores, reverse=True)[:n] if score >= min_score]
+
+    def _decayed(self, entity_name, now):
+        score, updated_at = self._scores.get(entity_name, (0, now))
+        return score * 0.5 ** ((now - updated_at) / self.half_life_s)
+
+
+class PrefetchScheduler(object):
+    """
+    Keeps the summaries of the hottest organizations/teams cached by refreshing them shortly before they expire, so
+    profile requests for them are answered without waiting on Github or Bitbucket.
+
+    Every interval_s seconds the hot_orgs hottest names are checked, hottest first, and each provider summary that is
+    not cached or expires within two intervals is refreshed with profiles.refresh_summary. Refreshes spend from a budget
+    of budget_per_min upstream calls per minute, a refresh that overspends is paid back from the following intervals.
+    With a shared cache every worker process runs a scheduler, but a summary another worker is already refreshing is
+    skipped, so each is refreshed once.
+    """
+
+    def __init__(self, app, budget_per_min, hot_orgs=HOT_ORGS, interval_s=INTERVAL_S):
+        self.app = app
+        self.budget_per_min = budget_per_min
+        self.hot_orgs = hot_orgs
+        self.interval_s = interval_s
+        self.allowance = 0
+        self.refreshes = 0
+        self.upstream_calls = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_once(self):
+        """
+        Refreshes the summaries due for a refresh within this interval's budget, must be called within an application
+        context
+        """
+        self.allowance = min(self.allowance + self.budget_per_min * self.interval_s / 60, self.budget_per_min)
+
+        for provider, entity_name in self.due():
+            if self.allowance <= 0:
+                return
+
+            with trace() as upstream:
+                refreshed = refresh_summary(provider, entity_name)
+            self.refreshes += refreshed
+            self.upstream_calls += upstream.total_calls()
+            self.allowance -= upstream.total_calls()
+
+    def due(self):
+        """
+        Generator of the (provider, name) summaries of the hottest names that are not cached or expire within two
+        intervals, hottest first
+        """
+        cache = get_summary_cache()
+        for entity_name in get_hot_orgs().hottest(self.hot_orgs):
+            for provider in PROVIDERS:
+                time_to_live = cache.time_to_live(("summary", provider, entity_name))
+                if time_to_live is None or time_to_live <= 2 * self.interval_s:
+                    yield provider, entity_name
+
+    def stats(self):
+        return {
+            "allowance": self.allowance,
+            "refreshes": self.refreshes,
+            "upstream_calls": self.upstream_calls,
+        }
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stopped.wait(self.interval_s):
+                try:
+                    self.run_once()
+                except Exception:
+                    current_app.logger.exception("Prefetch failed")
+
+
+def get_hot_orgs():
+    """
+    Returns the request frequency tracker of the current Flask application, created on first use
+    """
+    app = current_app._get_current_object()
+    with _extension_lock:
+        if "hot_orgs" not in app.extensions:
+            app.extensions["hot_orgs"] = HotOrgs()
+
+        return app.extensions["hot_orgs"]
+
+
+def record_request(entity_name):
+    """
+    Counts a profile request for the organization/team towards its hotness
+    """
+    get_hot_orgs().record(entity_name)
+
+
+def start_prefetch(app, budget_per_min, hot_orgs=HOT_ORGS, interval_s=INTERVAL_S):
+    """
+    Starts refreshing the hottest summaries of the application in a background thread, returning the scheduler
+    """
+    scheduler = PrefetchScheduler(app, budget_per_min, hot_orgs=hot_orgs, interval_s=interval_s)
+    app.extensions["prefetch"] = scheduler
+    scheduler.start()
+
+    return scheduler
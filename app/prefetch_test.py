@@ -0,0 +1,90 @@
+import unittest
+
+import flask
+import responses
+
+from app.cache import get_summary_cache
+from app.prefetch import HotOrgs, PrefetchScheduler, record_request
+from app.test_data import *
+
+
+class HotOrgsTestCase(unittest.TestCase):
+
+    def test_scores_decay(self):
+        clock = FakeClock()
+        hot_orgs = HotOrgs(half_life_s=60, clock=clock)
+        hot_orgs.record("org-1")
+        hot_orgs.record("org-1")
+        self.assertEqual(2, hot_orgs.score("org-1"))
+
+        clock.now += 60
+        self.assertEqual(1, hot_orgs.score("org-1"))
+        hot_orgs.record("org-1")
+        self.assertEqual(2, hot_orgs.score("org-1"))
+
+    def test_hottest(self):
+        hot_orgs = HotOrgs(clock=FakeClock())
+        for name in ["org-1", "org-2", "org-2", "org-3", "org-3", "org-3"]:
+            hot_orgs.record(name)
+
+        self.assertEqual(["org-3", "org-2"], hot_orgs.hottest(5))
+        self.assertEqual(["org-3"], hot_orgs.hottest(1))
+
+    def test_forgets_coldest(self):
+        hot_orgs = HotOrgs(max_tracked=2, clock=FakeClock())
+        for name in ["org-1", "org-2", "org-2", "org-2", "org-3", "org-3"]:
+            hot_orgs.record(name)
+
+        self.assertEqual(0, hot_orgs.score("org-1"))
+        self.assertEqual(3, hot_orgs.score("org-2"))
+        self.assertEqual(2, hot_orgs.score("org-3"))
+
+
+class PrefetchSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+
+    def add_responses(self, name):
+        responses.add(responses.GET, f"https://api.github.com/orgs/{name}/repos", json=[REPO_PUBLIC], status=200)
+        responses.add(responses.GET, f"https://api.bitbucket.org/2.0/repositories/{name}", json={"values": []},
+                      status=200)
+
+    @responses.activate
+    def test_refreshes_hot_summaries(self):
+        self.add_responses("org-1")
+        with self.app.app_context():
+            for name in ["org-1", "org-1", "org-2"]:
+                record_request(name)
+
+            scheduler = PrefetchScheduler(self.app, budget_per_min=60, interval_s=10)
+            scheduler.run_once()
+
+            self.assertEqual(2, len(responses.calls))
+            self.assertEqual(1, get_summary_cache().get(("summary", "github", "org-1")).original_repositories)
+            self.assertEqual({"allowance": 8, "refreshes": 2, "upstream_calls": 2}, scheduler.stats())
+
+            scheduler.run_once()
+            self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_budget(self):
+        for name in ["org-1", "org-2"]:
+            self.add_responses(name)
+        with self.app.app_context():
+            for name in ["org-1", "org-1", "org-1", "org-2", "org-2"]:
+                record_request(name)
+
+            scheduler = PrefetchScheduler(self.app, budget_per_min=6, interval_s=10)
+            scheduler.run_once()
+            self.assertEqual(["https://api.github.com/orgs/org-1/repos?per_page=100"],
+                             [call.request.url for call in responses.calls])
+
+            for _ in range(3):
+                scheduler.run_once()
+            self.assertEqual(4, len(responses.calls))
+            self.assertEqual(4, scheduler.refreshes)
+
+
+if __name__ == '__main__':
+    unittest.main()
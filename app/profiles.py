@@ -0,0 +1,258 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from requests import RequestException
+
+from app import bitbucket_api, github_api, github_graphql
+from app.cache import DEFAULT_TTL_S, get_summary_cache
+from app.deadlines import deadline
+from app.metrics import profile_pages, trace
+from app.snapshots import get_snapshot_store
+from app.summary import OrgSummary, summarize
+from app.workers import own_executors, with_app_context
+
+
+PROVIDERS = {
+    "github": github_api,
+    "bitbucket": bitbucket_api,
+}
+GITHUB_BACKENDS = {
+    "rest": github_api,
+    "graphql": github_graphql,
+}
+REFRESH_WORKERS = 2
+LOAD_WORKERS = 16
+FULL_REFRESH_S = 24 * 60 * 60
+
+_refresh_executor = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_load_executor = None
+_loads = {}
+_load_lock = threading.Lock()
+
+
+def get_provider(provider):
+    """
+    Returns the module fetching the provider's repositories, for Github the "github_backend" app config chooses between
+    the REST and GraphQL APIs
+    """
+    if provider == "github":
+        return GITHUB_BACKENDS[current_app.config.get("github_backend", "rest")]
+
+    return PROVIDERS[provider]
+
+
+def get_summary(provider, entity_name):
+    """
+    Returns the provider's summary for the organization/team, served from the summary cache while it is fresh.
+
+    On a cache miss the persisted snapshot is used if there is one: it is served as is while younger than the
+    "snapshot_max_age_s" app config, and once older it is still served while being refreshed in the background. Only
+    without a snapshot is the summary fetched from the provider before responding.
+    """
+    return get_summary_cache().get_or_load(("summary", provider, entity_name),
+                                           lambda: load_summary(provider, entity_name))
+
+
+def get_summary_later(provider, entity_name):
+    """
+    Returns a future of the provider's summary for the organization/team (see get_summary), loaded on a process wide
+    pool of "profile_load_workers" threads. Concurrent calls for the same summary share one load.
+
+    The load has no deadline and does not share the caller's executors, so a caller can wait for it only as long as its
+    own deadline allows and a load it gives up on still finishes and fills the cache for the next request.
+    """
+    global _load_executor
+    key = (provider, entity_name)
+    with _load_lock:
+        future = _loads.get(key)
+        if future is not None and not future.done():
+            return future
+
+        if _load_executor is None:
+            _load_executor = ThreadPoolExecutor(max_workers=current_app.config.get("profile_load_workers",
+                                                                                   LOAD_WORKERS))
+        future = _loads[key] = _load_executor.submit(with_app_context(_load_summary), provider, entity_name)
+
+    future.add_done_callback(lambda done: _load_done(key, done))
+    return future
+
+
+def loads_in_progress():
+    """
+    Returns the number of summaries being loaded by get_summary_later, including those no request waits for anymore
+    """
+    with _load_lock:
+        return sum(1 for future in _loads.values() if not future.done())
+
+
+def get_repos(provider, entity_name):
+    """
+    Returns the provider's raw repositories for the organization/team, served from the summary cache while it is fresh
+    """
+    return get_summary_cache().get_or_load(("repos", provider, entity_name),
+                                           lambda: list(get_provider(provider).get_repos(entity_name)))
+
+
+def load_summary(provider, entity_name):
+    store = get_snapshot_store()
+    snapshot = store.load(provider, entity_name) if store else None
+    if snapshot is None:
+        return fetch_summary(provider, entity_name)
+
+    if snapshot.age() >= current_app.config.get("snapshot_max_age_s", DEFAULT_TTL_S):
+        refresh_in_background(provider, entity_name)
+
+    return snapshot.summary
+
+
+def fetch_summary(provider, entity_name):
+    """
+    Fetches the provider's summary for the organization/team, persisting a snapshot of it if a store is configured.
+
+    If the provider can list just the repositories updated since a point in time and the stored snapshot has every
+    repository's version, only those updated repositories are fetched and applied to the snapshot. Updates cannot reveal
+    deleted repositories, so every repository is fetched again once the last full fetch is older than the
+    "snapshot_full_refresh_s" app config.
+
+    The repository pages fetched are recorded in the profile_pages metric.
+    """
+    with trace() as upstream:
+        summary = _fetch_summary(provider, entity_name)
+    profile_pages.observe(upstream.calls["repos"], provider=provider)
+
+    return summary
+
+
+def _fetch_summary(provider, entity_name):
+    store = get_snapshot_store()
+    if store is None:
+        return get_provider(provider).get(entity_name)
+
+    snapshot = store.load(provider, entity_name)
+    if can_update(provider, snapshot):
+        return fetch_updated_summary(provider, entity_name, snapshot, store)
+
+    repo_summaries = list(get_provider(provider).get_repo_summaries(entity_name))
+    summary = summarize(repo_summaries)
+    store.save(provider, entity_name, summary, repo_summaries)
+
+    return summary
+
+
+def can_update(provider, snapshot):
+    if snapshot is None or not snapshot.repo_summaries:
+        return False
+
+    if not hasattr(get_provider(provider), "get_updated_repo_summaries"):
+        return False
+
+    full_refresh_s = current_app.config.get("snapshot_full_refresh_s", FULL_REFRESH_S)
+    if time.time() - snapshot.full_fetched_at >= full_refresh_s:
+        return False
+
+    return all(r.get("id") is not None and r.get("updated_at") for r in snapshot.repo_summaries)
+
+
+def fetch_updated_summary(provider, entity_name, snapshot, store):
+    """
+    Applies the repositories updated since the snapshot to it, subtracting each one's previous contribution to the
+    summary and adding its new one, then persists the result
+    """
+    summary = OrgSummary.fromdict(snapshot.summary.asdict())
+    repo_summaries = {r["id"]: r for r in snapshot.repo_summaries}
+    since = max(r["updated_at"] for r in snapshot.repo_summaries)
+
+    for repo_summary in get_provider(provider).get_updated_repo_summaries(entity_name, since):
+        previous = repo_summaries.get(repo_summary["id"])
+        if previous is not None:
+            summary.remove(previous)
+
+        summary.accumulate(repo_summary)
+        repo_summaries[repo_summary["id"]] = repo_summary
+
+    store.save(provider, entity_name, summary, list(repo_summaries.values()),
+               full_fetched_at=snapshot.full_fetched_at)
+
+    return summary
+
+
+def refresh_in_background(provider, entity_name):
+    """
+    Schedules a refresh of the provider's summary on a background thread, unless one is already scheduled
+    """
+    global _refresh_executor
+    key = (provider, entity_name)
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+
+        _refreshing.add(key)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS)
+
+        future = _refresh_executor.submit(with_app_context(refresh_summary), provider, entity_name)
+
+    future.add_done_callback(lambda _: _refresh_done(key))
+
+
+def refresh_summary(provider, entity_name):
+    """
+    Fetches the provider's summary and replaces the cached summary with it (see the summary cache's refresh), returning
+    whether it did. Nothing is fetched if the summary is already being loaded, in this or (with a shared cache) another
+    worker process. Errors are logged and the stale summary is left in place. Refreshes are neither bound by the
+    deadline of the request that scheduled them nor share its executor.
+    """
+    try:
+        with deadline(None), own_executors():
+            return get_summary_cache().refresh(("summary", provider, entity_name),
+                                               lambda: fetch_summary(provider, entity_name))
+    except RequestException as e:
+        current_app.logger.error("Unable to refresh %s summary of %s: %s", provider, entity_name, e)
+        return False
+
+
+def shutdown_refreshes(wait=True):
+    """
+    Shuts down the background refresh executor, waiting for running refreshes if wait is set. A later refresh starts a
+    new executor, so this also serves to discard an executor inherited from a parent process after fork.
+    """
+    global _refresh_executor
+    with _refresh_lock:
+        executor, _refresh_executor = _refresh_executor, None
+        _refreshing.clear()
+
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def shutdown_loads(wait=True):
+    """
+    Shuts down the get_summary_later executor like shutdown_refreshes does the refresh executor
+    """
+    global _load_executor
+    with _load_lock:
+        executor, _load_executor = _load_executor, None
+        _loads.clear()
+
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _refresh_done(key):
+    with _refresh_lock:
+        _refreshing.discard(key)
+
+
+def _load_summary(provider, entity_name):
+    with deadline(None), own_executors():
+        return get_summary(provider, entity_name)
+
+
+def _load_done(key, future):
+    with _load_lock:
+        if _loads.get(key) is future:
+            del _loads[key]
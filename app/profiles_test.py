@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import flask
+import responses
+
+from app.profiles import fetch_summary, get_summary, get_summary_later, loads_in_progress
+from app.snapshots import SnapshotStore, get_snapshot_store
+from app.summary import OrgSummary, summarize
+from app.test_data import *
+
+
+def create_app(snapshot_path):
+    app = flask.Flask(__name__)
+    app.config["snapshot_path"] = snapshot_path
+    app.config["snapshot_max_age_s"] = 60
+    return app
+
+
+class ProfilesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(directory, "snapshots.db")
+
+    @responses.activate
+    def test_get_summary_persisted(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC, REPO_PUBLIC_FORK], status=200)
+
+        with create_app(self.snapshot_path).app_context():
+            self.assertEqual(2, get_summary("github", "org-1").original_repositories +
+                             get_summary("github", "org-1").forked_repositories)
+            self.assertEqual(2, len(get_snapshot_store().load("github", "org-1").repo_summaries))
+
+        # a restarted process serves the snapshot rather than calling Github
+        with create_app(self.snapshot_path).app_context():
+            self.assertEqual(3, get_summary("github", "org-1").watchers)
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_get_summary_stale_while_revalidate(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC], status=200)
+        SnapshotStore(self.snapshot_path).save("github", "org-1", OrgSummary(watchers=10), [], fetched_at=0)
+
+        with create_app(self.snapshot_path).app_context():
+            self.assertEqual(10, get_summary("github", "org-1").watchers)
+
+            deadline = time.time() + 5
+            while get_summary("github", "org-1").watchers == 10 and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(1, get_summary("github", "org-1").watchers)
+            self.assertEqual(1, get_snapshot_store().load("github", "org-1").summary.watchers)
+
+    @responses.activate
+    def test_get_summary_later_shared(self):
+        release = threading.Event()
+
+        def slow_github(request):
+            release.wait(5)
+            return 200, {}, json.dumps([REPO_PUBLIC])
+
+        responses.add_callback(responses.GET, "https://api.github.com/orgs/org-1/repos", callback=slow_github)
+
+        with create_app(self.snapshot_path).app_context():
+            future = get_summary_later("github", "org-1")
+            self.assertIs(future, get_summary_later("github", "org-1"))
+            self.assertEqual(1, loads_in_progress())
+
+            release.set()
+            self.assertEqual(1, future.result().watchers)
+            self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_fetch_summary_updates_incrementally(self):
+        original = {**REPO_PUBLIC, "id": 1, "updated_at": "2020-01-01T00:00:00Z"}
+        unchanged = {**REPO_PUBLIC_FORK, "id": 2, "updated_at": "2020-01-02T00:00:00Z"}
+        updated = {**original, "watchers_count": 5, "updated_at": "2020-01-03T00:00:00Z"}
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[updated, unchanged, {**REPO_PUBLIC, "id": 3, "updated_at": "2019-01-01T00:00:00Z"}],
+                      status=200)
+        SnapshotStore(self.snapshot_path).save("github", "org-1", summarize([original, unchanged]),
+                                               [original, unchanged])
+
+        with create_app(self.snapshot_path).app_context():
+            summary = fetch_summary("github", "org-1")
+
+            self.assertEqual(summarize([updated, unchanged]), summary)
+            self.assertEqual(summary, get_snapshot_store().load("github", "org-1").summary)
+        self.assertIn("sort=updated", responses.calls[0].request.url)
+
+    @responses.activate
+    def test_fetch_summary_full_refresh(self):
+        original = {**REPO_PUBLIC, "id": 1, "updated_at": "2020-01-01T00:00:00Z"}
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos", json=[], status=200)
+        SnapshotStore(self.snapshot_path).save("github", "org-1", summarize([original]), [original],
+                                               full_fetched_at=0)
+
+        with create_app(self.snapshot_path).app_context():
+            self.assertEqual(OrgSummary(), fetch_summary("github", "org-1"))
+        self.assertNotIn("sort=updated", responses.calls[0].request.url)
+
+
+if __name__ == '__main__':
+    unittest.main()
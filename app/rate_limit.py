@@ -0,0 +1,199 @@
+import threading
+import time
+
+from flask import current_app
+from requests import RequestException
+
+
+MAX_WAIT_S = 60
+RATE_LIMITED_STATUSES = (403, 429)
+CORE = "core"
+GRAPHQL = "graphql"
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimitExceeded(RequestException):
+    """
+    Raised when a request would have to wait longer than allowed for its credential's rate limit to reset, retry_after_s
+    is how long until it resets
+    """
+
+    def __init__(self, message, retry_after_s=None):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class RateLimiter(object):
+    """
+    Schedules the requests made with one credential so they stay within its rate limit.
+
+    The remaining quota and its reset time are tracked from the X-RateLimit-Remaining/X-RateLimit-Reset (or
+    Retry-After) headers of each response, and requests queue until the reset once the quota is used up instead of
+    failing. Optionally a token bucket of burst tokens, refilled at rate_per_s, also paces requests below the quota.
+    """
+
+    def __init__(self, rate_per_s=None, burst=1, max_wait_s=MAX_WAIT_S, clock=time.time, sleep=time.sleep):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_wait_s = max_wait_s
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._refilled_at = clock()
+        self.remaining = None
+        self.reset_at = None
+        self.used = 0
+
+    def acquire(self):
+        """
+        Blocks until a request may be made, raises RateLimitExceeded if that would take longer than max_wait_s
+        """
+        waited = 0
+        while True:
+            with self._lock:
+                wait = self._reserve()
+            if wait <= 0:
+                return
+
+            if waited + wait > self.max_wait_s:
+                raise RateLimitExceeded(f"Rate limited, the limit resets in {wait:.0f}s", retry_after_s=wait)
+            self._sleep(wait)
+            waited += wait
+
+    def try_acquire(self):
+        """
+        Takes a request from the quota and token bucket if one is available right away, returning whether it did
+        """
+        with self._lock:
+            return self._reserve() <= 0
+
+    def update(self, response):
+        """
+        Updates the remaining quota from the rate limit headers of a response. Returns True if the response was
+        rejected for exceeding the rate limit, in which case the request should be retried once acquire returns.
+
+        A 429, or a 403 once the quota is used up, is a rejection. So is a 403 with a Retry-After while quota remains,
+        which is how Github signals its secondary (abuse) rate limits.
+        """
+        headers = response.headers
+        now = self._clock()
+        with self._lock:
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                self.reset_at = float(headers["X-RateLimit-Reset"])
+
+            limited = response.status_code == 429 or (response.status_code in RATE_LIMITED_STATUSES and
+                                                      (self.remaining == 0 or "Retry-After" in headers))
+            if limited:
+                self.remaining = 0
+                if "Retry-After" in headers:
+                    self.reset_at = now + float(headers["Retry-After"])
+                elif self.reset_at is None or self.reset_at <= now:
+                    self.reset_at = now + 1
+
+            return limited
+
+    def update_quota(self, remaining, reset_at):
+        """
+        Updates the remaining quota and the time it resets at (in seconds since the epoch) from a quota reported in a
+        response body rather than its headers, such as the rateLimit of a GraphQL query
+        """
+        with self._lock:
+            self.remaining = remaining
+            self.reset_at = reset_at
+
+    def headroom(self):
+        """
+        Returns a sortable measure of how readily this limiter admits a request: a credential with an unknown quota
+        ranks first, then by remaining quota, and an exhausted one ranks last ordered by how soon it resets. Ties, such
+        as between credentials of a provider that reports no quota, go to the one that has made the fewest requests.
+        """
+        now = self._clock()
+        with self._lock:
+            if self.remaining is None or (self.reset_at is not None and self.reset_at <= now):
+                return 1, float("inf"), -self.used
+            if self.remaining > 0:
+                return 1, self.remaining, -self.used
+
+            return 0, -self.reset_at, -self.used
+
+    def _reserve(self):
+        """
+        Takes a request from the quota and token bucket, returning 0, or the seconds to wait if none is available
+        """
+        now = self._clock()
+        if self.reset_at is not None and self.reset_at <= now:
+            self.remaining = None
+            self.reset_at = None
+
+        if self.remaining is not None and self.remaining <= 0:
+            return self.reset_at - now
+
+        if self.rate_per_s:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate_per_s
+            self._tokens -= 1
+
+        if self.remaining is not None:
+            self.remaining -= 1
+        self.used += 1
+
+        return 0
+
+
+def get_limiter(provider, token, resource=CORE):
+    """
+    Returns the process wide rate limiter for the provider, credential (None when unauthenticated) and resource, created
+    on first use from the "<provider>_requests_per_s", "<provider>_burst" and "rate_limit_max_wait_s" app config.
+
+    A provider may limit some of its APIs separately, such as Github's GraphQL API which has its own quota per token
+    apart from the REST API's, each is a resource with its own limiter.
+    """
+    config = current_app.config
+    key = (provider, token, resource)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(rate_per_s=config.get(f"{provider}_requests_per_s"),
+                                         burst=config.get(f"{provider}_burst", 1),
+                                         max_wait_s=config.get("rate_limit_max_wait_s", MAX_WAIT_S))
+
+        return _limiters[key]
+
+
+def get_tokens(provider):
+    """
+    Returns the pool of credentials for the provider, from the "<provider>_tokens" app config or else the single
+    "<provider>_token" (a pool of just None when unauthenticated)
+    """
+    config = current_app.config
+    return config.get(f"{provider}_tokens") or [config.get(f"{provider}_token")]
+
+
+def choose_token(provider, resource=CORE):
+    """
+    Chooses the credential of the provider's pool to make the next request for the resource with, the one with the most
+    remaining quota, or the one that has made the fewest requests when their quotas are unknown (Bitbucket reports
+    none), so requests rotate through the pool. Exhausted credentials are out of rotation until they reset, unless every
+    credential is exhausted in which case the one resetting soonest is chosen and the request queues on its limiter.
+    """
+    return max(get_tokens(provider), key=lambda token: get_limiter(provider, token, resource).headroom())
+
+
+def next_credentials(provider, headers_for_token, resource=CORE):
+    """
+    Returns the headers (built by headers_for_token) and the rate limiter of the provider's credential to make the next
+    request for the resource with, see choose_token
+    """
+    token = choose_token(provider, resource)
+    return headers_for_token(token), get_limiter(provider, token, resource)
+
+
+def reset_limiters():
+    with _limiters_lock:
+        _limiters.clear()
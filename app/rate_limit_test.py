@@ -0,0 +1,162 @@
+import functools
+import time
+import unittest
+
+import flask
+import responses
+
+from app import net
+from app.rate_limit import (RateLimiter, RateLimitExceeded, choose_token, get_limiter, next_credentials,
+                            reset_limiters)
+from app.test_data import FakeClock
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, **kwargs):
+        return RateLimiter(clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_unlimited(self):
+        limiter = self.limiter()
+        for _ in range(100):
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_waits_for_reset_once_exhausted(self):
+        limiter = self.limiter()
+        self.assertFalse(limiter.update(FakeResponse(headers={"X-RateLimit-Remaining": "1",
+                                                              "X-RateLimit-Reset": "1030"})))
+        limiter.acquire()
+        limiter.acquire()
+
+        self.assertEqual([30], self.clock.sleeps)
+
+    def test_rate_limited_response(self):
+        limiter = self.limiter()
+        self.assertTrue(limiter.update(FakeResponse(429, headers={"Retry-After": "5"})))
+        self.assertTrue(limiter.update(FakeResponse(403, headers={"X-RateLimit-Remaining": "0",
+                                                                  "X-RateLimit-Reset": "1010"})))
+        self.assertFalse(self.limiter().update(FakeResponse(403)))
+        limiter.acquire()
+
+        self.assertEqual([10], self.clock.sleeps)
+
+    def test_secondary_rate_limit(self):
+        limiter = self.limiter()
+        self.assertTrue(limiter.update(FakeResponse(403, headers={"X-RateLimit-Remaining": "4000",
+                                                                  "Retry-After": "30"})))
+        limiter.acquire()
+
+        self.assertEqual([30], self.clock.sleeps)
+
+    def test_max_wait(self):
+        limiter = self.limiter(max_wait_s=10)
+        limiter.update(FakeResponse(429, headers={"Retry-After": "60"}))
+
+        with self.assertRaises(RateLimitExceeded) as raised:
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+        self.assertEqual(60, raised.exception.retry_after_s)
+
+    def test_token_bucket(self):
+        limiter = self.limiter(rate_per_s=2, burst=2)
+        for _ in range(4):
+            limiter.acquire()
+
+        self.assertEqual([0.5, 0.5], self.clock.sleeps)
+
+    @responses.activate
+    def test_conditional_get_retries_after_reset(self):
+        responses.add(responses.GET, "http://dummy-url/limited", json={"error": "slow down"}, status=429,
+                      headers={"Retry-After": "1"})
+        responses.add(responses.GET, "http://dummy-url/limited", json={"unit-test": "data"}, status=200)
+
+        r = net.conditional_get("http://dummy-url/limited", limiter=self.limiter())
+        self.assertEqual({"unit-test": "data"}, r.json())
+        self.assertEqual(2, len(responses.calls))
+        self.assertEqual([1], self.clock.sleeps)
+
+
+class TokenPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        reset_limiters()
+        self.app = flask.Flask(__name__)
+        self.app.config["github_tokens"] = ["a", "b", "c"]
+
+    def tearDown(self):
+        reset_limiters()
+
+    def quota(self, token, remaining, reset_in=3600):
+        get_limiter("github", token).update(FakeResponse(headers={"X-RateLimit-Remaining": str(remaining),
+                                                                  "X-RateLimit-Reset": str(time.time() + reset_in)}))
+
+    def test_single_token(self):
+        with self.app.app_context():
+            self.assertIsNone(choose_token("bitbucket"))
+            self.app.config["bitbucket_token"] = "x"
+            self.assertEqual("x", choose_token("bitbucket"))
+
+    @responses.activate
+    def test_rotates_tokens_without_quota(self):
+        responses.add(responses.GET, "http://dummy-url/bitbucket", json={}, status=200)
+        self.app.config["bitbucket_tokens"] = ["x", "y"]
+
+        with self.app.app_context():
+            credentials = functools.partial(next_credentials, "bitbucket",
+                                            lambda token: {"Authorization": f"Bearer {token}"})
+            for _ in range(4):
+                net.conditional_get("http://dummy-url/bitbucket", credentials=credentials)
+
+        self.assertEqual(["Bearer x", "Bearer y", "Bearer x", "Bearer y"],
+                         [call.request.headers["Authorization"] for call in responses.calls])
+
+    def test_spreads_by_remaining_quota(self):
+        with self.app.app_context():
+            self.quota("a", 10)
+            self.quota("b", 50)
+            self.assertEqual("c", choose_token("github"))
+
+            self.quota("c", 20)
+            self.assertEqual("b", choose_token("github"))
+
+    def test_exhausted_tokens_out_of_rotation(self):
+        with self.app.app_context():
+            self.quota("a", 0, reset_in=60)
+            self.quota("b", 0, reset_in=30)
+            self.quota("c", 1)
+            self.assertEqual("c", choose_token("github"))
+
+            get_limiter("github", "c").acquire()
+            self.assertEqual("b", choose_token("github"))
+
+    @responses.activate
+    def test_rejected_request_retried_with_next_token(self):
+        responses.add(responses.GET, "http://dummy-url/limited", json={"error": "slow down"}, status=403,
+                      headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 3600)})
+        responses.add(responses.GET, "http://dummy-url/limited", json={"unit-test": "data"}, status=200)
+
+        with self.app.app_context():
+            self.quota("a", 10)
+            self.quota("b", 5)
+            self.quota("c", 1)
+            r = net.conditional_get("http://dummy-url/limited",
+                                    credentials=functools.partial(next_credentials, "github",
+                                                                  lambda token: {"Authorization": f"token {token}"}))
+
+        self.assertEqual({"unit-test": "data"}, r.json())
+        self.assertEqual(["token a", "token b"], [call.request.headers["Authorization"] for call in responses.calls])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,61 @@
+import itertools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import flask
 from flask import Response
-from flask import jsonify, request
-from requests import HTTPError
+from flask import json, jsonify, request, stream_with_context
+from requests import RequestException
 
-from app import bitbucket_api, github_api
-from app.errors import ClientRequestError
-from app.summary import combine
+from app import metrics, net
+from app.cache import get_summary_cache
+from app.deadlines import deadline, remaining
+from app.errors import ClientRequestError, UpstreamRateLimitedError
+from app.logs import log_trace_summary
+from app.prefetch import record_request
+from app.profiles import PROVIDERS, get_provider, get_repos, get_summary, get_summary_later, loads_in_progress
+from app.rate_limit import RateLimitExceeded
+from app.summary import combine_all
+from app.workers import shared_executor, with_app_context
 
 app = flask.Flask("user_profiles_api")
 
+BATCH_WORKERS = 8
+BATCH_FAN_OUT_WORKERS = 16
+MAX_BATCH_NAMES = 500
+MAX_DEADLINE_S = 60
+
+
+def repos_response(provider, entity_name):
+    """
+    Returns the provider's raw repositories as a json array, or with "format=ndjson" as newline delimited json streamed
+    as the repositories are fetched, so memory stays flat however large the organization/team is.
+    """
+    if request.args.get("format") != "ndjson":
+        return jsonify(get_repos(provider, entity_name))
+
+    repos = get_summary_cache().get(("repos", provider, entity_name))
+    if repos is None:
+        repos = get_provider(provider).get_repos(entity_name)
+
+    return ndjson_response(repos)
+
+
+def ndjson_response(items):
+    """
+    Returns a response streaming each item as a line of json as it is produced. The first item is produced before the
+    response starts, so an error producing it is raised from the view instead of cutting the stream short.
+    """
+    items = iter(items)
+    first = list(itertools.islice(items, 1))
+
+    def generate():
+        for item in itertools.chain(first, items):
+            yield json.dumps(item) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 
 @app.route("/health-check", methods=["GET"])
 def health_check():
@@ -24,15 +71,119 @@ def profile():
     """
     Returns the combined organization/team profile from Github and Bitbucket.
 
-    If any error occurs in either service, a 400 is returned to the client.
+    Both services are queried concurrently, so the latency is that of the slower service rather than the sum of both.
+    If any error occurs in either service, a 400 is returned to the client, or a 503 with a Retry-After if a service's
+    rate limit is used up. A summary of the upstream calls made for the
+    profile is logged once it is done.
+
+    Each service has until a deadline to respond, "deadline" seconds if given or else the "profile_deadline_s" app
+    config (none by default). The profile combines the services that responded in time, and lists those that did not
+    under "incomplete". The services are loaded in the background (see profiles.get_summary_later), so one that misses
+    the deadline still finishes and fills the cache for the next request.
+    """
+    entity_name = request.args.get('name')
+    deadline_s = get_deadline()
+    record_request(entity_name)
+    start = time.perf_counter()
+    with metrics.trace() as upstream, deadline(deadline_s):
+        try:
+            futures = {provider: get_summary_later(provider, entity_name) for provider in PROVIDERS}
+            done, _ = wait(futures.values(), timeout=remaining())
+
+            summaries = [future.result() for future in futures.values() if future in done]
+            incomplete_providers = [provider for provider, future in futures.items() if future not in done]
+            for provider in incomplete_providers:
+                metrics.profile_deadline_misses.inc(provider=provider)
+            return jsonify(profile_response(combine_all(summaries), incomplete_providers))
+        except RequestException as e:
+            app.logger.error("Unable to construct profile: %s", e)
+
+            raise upstream_error(e)
+        finally:
+            elapsed_s = time.perf_counter() - start
+            metrics.profile_latency.observe(elapsed_s)
+            log_trace_summary(entity_name, upstream, elapsed_s)
+
+
+def upstream_error(e):
+    """
+    Returns the error to answer a failed upstream request with
     """
+    if isinstance(e, RateLimitExceeded):
+        return UpstreamRateLimitedError(str(e), retry_after_s=e.retry_after_s)
+
+    return ClientRequestError(str(e))
+
+
+def get_deadline():
+    """
+    Returns the profile deadline in seconds from the "deadline" query parameter or the "profile_deadline_s" app config,
+    None if there is neither
+    """
+    if "deadline" not in request.args:
+        return app.config.get("profile_deadline_s")
+
     try:
-        entity_name = request.args.get('name')
-        return jsonify(combine(github_api.get(entity_name), bitbucket_api.get(entity_name)).asdict())
-    except HTTPError as e:
-        app.logger.error("Unable to construct profile: %s", e)
+        deadline_s = float(request.args["deadline"])
+    except ValueError:
+        deadline_s = 0
+    if not 0 < deadline_s <= MAX_DEADLINE_S:
+        raise ClientRequestError(f"The deadline must be a number of seconds between 0 and {MAX_DEADLINE_S}")
 
-        raise ClientRequestError(str(e))
+    return deadline_s
+
+
+def profile_response(summary, incomplete_providers):
+    """
+    Returns the summary as a dict, with an "incomplete" section listing the providers that did not respond in time if
+    there are any
+    """
+    response = summary.asdict()
+    if incomplete_providers:
+        response["incomplete"] = {"providers": incomplete_providers}
+
+    return response
+
+
+@app.route("/v1/profiles", methods=["POST"])
+def profiles():
+    """
+    Returns the combined profiles of many organizations/teams, given as a json body such as {"names": ["a", "b"]}.
+
+    Every provider fetch for every name is scheduled on one pool of "batch_workers" threads, so a slow organization only
+    holds up the workers fetching it. Their Bitbucket watcher lookups and Github page fetches share a second pool of
+    "batch_fan_out_workers" threads, so the threads a batch starts are bounded however many names it has. Names whose
+    profile could not be constructed, for whatever reason, are reported under "errors" rather than failing the whole
+    batch.
+    """
+    body = request.get_json(silent=True)
+    names = body.get("names") if isinstance(body, dict) else None
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ClientRequestError('Expected a json body with a list of "names"')
+    if len(names) > MAX_BATCH_NAMES:
+        raise ClientRequestError(f"At most {MAX_BATCH_NAMES} names can be requested at once")
+
+    for name in names:
+        record_request(name)
+
+    results = {}
+    errors = {}
+    with shared_executor(app.config.get("batch_fan_out_workers", BATCH_FAN_OUT_WORKERS)), \
+            ThreadPoolExecutor(max_workers=app.config.get("batch_workers", BATCH_WORKERS)) as executor:
+        summary = with_app_context(get_summary)
+        pending = {name: [executor.submit(summary, provider, name) for provider in PROVIDERS] for name in names}
+
+        for name, summaries in pending.items():
+            try:
+                results[name] = combine_all(future.result() for future in summaries).asdict()
+            except RequestException as e:
+                app.logger.error("Unable to construct profile for %s: %s", name, e)
+                errors[name] = upstream_error(e).to_dict()
+            except Exception:
+                app.logger.exception("Unexpected error constructing profile for %s", name)
+                errors[name] = {"message": "Unable to construct profile", "status_code": 500}
+
+    return jsonify({"profiles": results, "errors": errors})
 
 
 @app.route("/v1/debug/github", methods=["GET"])
@@ -40,7 +191,7 @@ def debug_github():
     """
     Returns the Github organization summary
     """
-    return jsonify(github_api.get(request.args.get('name')).asdict())
+    return jsonify(get_summary("github", request.args.get('name')).asdict())
 
 
 @app.route("/v1/debug/github/repos", methods=["GET"])
@@ -48,7 +199,7 @@ def debug_github_repos():
     """
     Returns the raw Github repos response
     """
-    return jsonify(list(github_api.get_repos(request.args.get('name'))))
+    return repos_response("github", request.args.get('name'))
 
 
 @app.route("/v1/debug/bitbucket", methods=["GET"])
@@ -56,7 +207,7 @@ def debug_bitbucket():
     """
     Returns the Bitbucket team summary
     """
-    return jsonify(bitbucket_api.get(request.args.get('name')).asdict())
+    return jsonify(get_summary("bitbucket", request.args.get('name')).asdict())
 
 
 @app.route("/v1/debug/bitbucket/repos", methods=["GET"])
@@ -64,11 +215,53 @@ def debug_bitbucket_repos():
     """
     Returns the raw Bitbucket repos response
     """
-    return jsonify(list(bitbucket_api.get_repos(request.args.get('name'))))
+    return repos_response("bitbucket", request.args.get('name'))
+
+
+@app.route("/v1/debug/connections", methods=["GET"])
+def debug_connections():
+    """
+    Returns the number of upstream connections opened versus reused by the shared session
+    """
+    return jsonify(net.connection_stats.asdict())
+
+
+@app.route("/v1/debug/cache", methods=["GET"])
+def debug_cache():
+    """
+    Returns the summary cache hit, miss and eviction counts
+    """
+    return jsonify(get_summary_cache().stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Returns the upstream latency, retry, pages per profile and profile latency metrics along with the summary cache and
+    connection statistics, in the Prometheus text format
+    """
+    cache_stats = get_summary_cache().stats()
+    connections = net.connection_stats.asdict()
+    extra = [(f"summary_cache_{name}_total", f"Summary cache {name}", "counter", cache_stats[name])
+             for name in ("hits", "misses", "coalesced", "evictions")]
+    extra += [("summary_cache_entries", "Summaries currently cached", "gauge", cache_stats["entries"]),
+              ("profile_loads_in_progress", "Provider summaries being loaded for profiles, including those past their "
+               "deadline", "gauge", loads_in_progress())]
+    extra += [(f"upstream_connections_{name}_total", f"Upstream connections {name}", "counter", connections[name])
+              for name in ("opened", "reused")]
+    if "prefetch" in app.extensions:
+        prefetch = app.extensions["prefetch"].stats()
+        extra += [("prefetch_refreshes_total", "Summaries refreshed ahead of expiry", "counter", prefetch["refreshes"]),
+                  ("prefetch_upstream_calls_total", "Upstream calls spent refreshing ahead of expiry", "counter",
+                   prefetch["upstream_calls"])]
+
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
 
 
 @app.errorhandler(ClientRequestError)
 def handle_not_found(error):
     response = jsonify(error.to_dict())
     response.status_code = error.status_code
+    if getattr(error, "retry_after_s", None) is not None:
+        response.headers["Retry-After"] = str(math.ceil(error.retry_after_s))
     return response
@@ -0,0 +1,193 @@
+import json
+import threading
+import unittest
+
+import responses
+
+from app import metrics
+from app.cache import get_summary_cache
+from app.rate_limit import reset_limiters
+from app.routes import app
+from app.test_data import *
+
+
+class RoutesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            get_summary_cache().clear()
+        metrics.reset()
+
+    @responses.activate
+    def test_profile(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC, REPO_PRIVATE], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"values": [{"is_private": False, "parent": 1, "language": "Python"}]}, status=200)
+
+        response = self.client.get("/v1/profile?name=org-1")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({
+            "forked_repositories": 1,
+            "languages": {
+                "Python": 2
+            },
+            "original_repositories": 1,
+            "topics": {
+                "programming": 1,
+                "fun": 1
+            },
+            "watchers_count": 1}, response.get_json())
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_profile_cached(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"values": []}, status=200)
+
+        self.assertEqual(self.client.get("/v1/profile?name=org-1").get_json(),
+                         self.client.get("/v1/profile?name=org-1").get_json())
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_profile_errors(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"error": "barf"}, status=404)
+
+        response = self.client.get("/v1/profile?name=org-1")
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(400, response.get_json()["status_code"])
+
+    @responses.activate
+    def test_profile_rate_limited(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-limited/repos", status=429,
+                      headers={"Retry-After": "120"})
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-limited",
+                      json={"values": []}, status=200)
+        app.config["rate_limit_max_wait_s"] = 1
+        try:
+            response = self.client.get("/v1/profile?name=org-limited")
+        finally:
+            del app.config["rate_limit_max_wait_s"]
+            reset_limiters()
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("120", response.headers["Retry-After"])
+
+    @responses.activate
+    def test_profiles(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"values": []}, status=200)
+        responses.add(responses.GET, "https://api.github.com/orgs/org-2/repos",
+                      json={"error": "barf"}, status=404)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-2",
+                      json={"values": []}, status=200)
+
+        response = self.client.post("/v1/profiles", json={"names": ["org-1", "org-2"]})
+        self.assertEqual(200, response.status_code)
+        body = response.get_json()
+        self.assertEqual(["org-1"], list(body["profiles"]))
+        self.assertEqual(1, body["profiles"]["org-1"]["original_repositories"])
+        self.assertEqual(["org-2"], list(body["errors"]))
+        self.assertEqual(400, body["errors"]["org-2"]["status_code"])
+
+    @responses.activate
+    def test_profiles_unexpected_error(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"values": [{"links": {"watchers": {"href": "http://watchers-1"}}}]}, status=200)
+        responses.add(responses.GET, "http://watchers-1", json={"size": 2, "values": []}, status=200)
+        # a repository missing the fields the summary reads
+        responses.add(responses.GET, "https://api.github.com/orgs/org-2/repos",
+                      json=[{"name": "malformed"}], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-2",
+                      json={"values": []}, status=200)
+
+        response = self.client.post("/v1/profiles", json={"names": ["org-1", "org-2"]})
+        self.assertEqual(200, response.status_code)
+        body = response.get_json()
+        self.assertEqual(3, body["profiles"]["org-1"]["watchers_count"])
+        self.assertEqual(500, body["errors"]["org-2"]["status_code"])
+
+    def test_profiles_invalid(self):
+        self.assertEqual(400, self.client.post("/v1/profiles", json={"names": "org-1"}).status_code)
+        self.assertEqual(400, self.client.post("/v1/profiles", data="names").status_code)
+
+    @responses.activate
+    def test_debug_repos_ndjson(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC, REPO_PRIVATE], status=200)
+
+        response = self.client.get("/v1/debug/github/repos?name=org-1&format=ndjson")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/x-ndjson", response.mimetype)
+        self.assertEqual([REPO_PUBLIC, REPO_PRIVATE], [json.loads(line) for line in response.data.splitlines()])
+
+    @responses.activate
+    def test_debug_repos_ndjson_errors(self):
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"error": "barf"}, status=404)
+
+        response = self.client.get("/v1/debug/bitbucket/repos?name=org-1&format=ndjson")
+        self.assertEqual(500, response.status_code)
+
+    @responses.activate
+    def test_metrics(self):
+        responses.add(responses.GET, "https://api.github.com/orgs/org-1/repos",
+                      json=[REPO_PUBLIC], status=200)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-1",
+                      json={"values": []}, status=200)
+        self.client.get("/v1/profile?name=org-1")
+        self.client.get("/v1/profile?name=org-1")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(200, response.status_code)
+        text = response.get_data(as_text=True)
+        self.assertIn('upstream_request_duration_seconds_count{provider="github",endpoint="repos"} 1', text)
+        self.assertIn('upstream_request_duration_seconds_count{provider="bitbucket",endpoint="repos"} 1', text)
+        self.assertIn('profile_pages_bucket{provider="github",le="1"} 1', text)
+        self.assertIn("profile_request_duration_seconds_count 2", text)
+        self.assertIn("summary_cache_hits_total 2", text)
+
+    @responses.activate
+    def test_profile_deadline_incomplete_provider(self):
+        release = threading.Event()
+
+        def slow_github(request):
+            release.wait(5)
+            return 200, {}, json.dumps([REPO_PUBLIC])
+
+        responses.add_callback(responses.GET, "https://api.github.com/orgs/org-slow/repos", callback=slow_github)
+        responses.add(responses.GET, "https://api.bitbucket.org/2.0/repositories/org-slow",
+                      json={"values": [{"is_private": False, "language": "Python"}]}, status=200)
+
+        response = self.client.get("/v1/profile?name=org-slow&deadline=0.1")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"providers": ["github"]}, response.get_json()["incomplete"])
+        self.assertEqual(1, response.get_json()["original_repositories"])
+        self.assertEqual(1, metrics.profile_deadline_misses.value(provider="github"))
+
+        # a request without a deadline shares the load the first one gave up on, which finishes and fills the cache
+        release.set()
+        response = self.client.get("/v1/profile?name=org-slow")
+        self.assertNotIn("incomplete", response.get_json())
+        self.assertEqual(2, response.get_json()["original_repositories"])
+        self.assertEqual(1, len([call for call in responses.calls if "api.github.com" in call.request.url]))
+        with app.app_context():
+            self.assertIsNotNone(get_summary_cache().get(("summary", "github", "org-slow")))
+
+    def test_profile_invalid_deadline(self):
+        self.assertEqual(400, self.client.get("/v1/profile?name=org-1&deadline=soon").status_code)
+        self.assertEqual(400, self.client.get("/v1/profile?name=org-1&deadline=0").status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
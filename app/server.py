@@ -0,0 +1,87 @@
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+
+from app import metrics, net, profiles, rate_limit
+
+
+WORKERS = multiprocessing.cpu_count() * 2 + 1
+THREADS = 8
+GRACEFUL_TIMEOUT_S = 30
+BIND = "127.0.0.1:5000"
+
+PER_PROCESS_EXTENSIONS = ("summary_cache", "hot_orgs", "snapshot_store", "prefetch")
+
+
+class ProductionServer(BaseApplication):
+    """
+    Serves the Flask application with gunicorn: a master process forks the given number of worker processes, each
+    serving requests from a pool of threads.
+
+    The application is loaded once in the master before forking. Everything that is created lazily per process (the
+    pooled HTTP session, rate limiters, caches, the snapshot store connection and background threads) is discarded in
+    each new worker so it is created afresh there rather than shared with the master. On SIGTERM workers stop accepting
+    connections and are given graceful_timeout_s to finish their requests before they are killed.
+
+    on_worker_start, if given, is called with the Flask application in each new worker, such as to start prefetching.
+    """
+
+    def __init__(self, flask_app, workers=WORKERS, threads=THREADS, bind=BIND, graceful_timeout_s=GRACEFUL_TIMEOUT_S,
+                 on_worker_start=None):
+        self.flask_app = flask_app
+        self.on_worker_start = on_worker_start
+        self.options = {
+            "bind": bind,
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread",
+            "graceful_timeout": graceful_timeout_s,
+            "preload_app": True,
+            "post_fork": self.post_fork,
+            "worker_exit": self.worker_exit,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.flask_app
+
+    def post_fork(self, server, worker):
+        reset_after_fork(self.flask_app)
+        if self.on_worker_start is not None:
+            self.on_worker_start(self.flask_app)
+
+    def worker_exit(self, server, worker):
+        shutdown(self.flask_app)
+
+
+def reset_after_fork(flask_app):
+    """
+    Discards the per process state a worker inherited from its parent, so each worker creates its own
+    """
+    for name in PER_PROCESS_EXTENSIONS:
+        flask_app.extensions.pop(name, None)
+    net.reset_session()
+    net.connection_stats.reset()
+    rate_limit.reset_limiters()
+    profiles.shutdown_refreshes(wait=False)
+    profiles.shutdown_loads(wait=False)
+    metrics.reset()
+
+
+def shutdown(flask_app):
+    """
+    Stops the background work of a worker that is exiting and releases its connections
+    """
+    scheduler = flask_app.extensions.pop("prefetch", None)
+    if scheduler is not None:
+        scheduler.stop()
+    profiles.shutdown_refreshes(wait=True)
+    profiles.shutdown_loads(wait=True)
+    store = flask_app.extensions.pop("snapshot_store", None)
+    if store is not None:
+        store.close()
+    net.reset_session()
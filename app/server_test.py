@@ -0,0 +1,38 @@
+import unittest
+
+import flask
+
+from app import net, rate_limit
+from app.cache import get_summary_cache
+from app.server import ProductionServer, reset_after_fork
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def test_reset_after_fork(self):
+        app = flask.Flask(__name__)
+        with app.app_context():
+            get_summary_cache().put("key", "value")
+            limiter = rate_limit.get_limiter("github", "token")
+            session = net.get_session()
+
+            reset_after_fork(app)
+
+            self.assertIsNone(get_summary_cache().get("key"))
+            self.assertIsNot(limiter, rate_limit.get_limiter("github", "token"))
+            self.assertIsNot(session, net.get_session())
+
+    def test_options(self):
+        app = flask.Flask(__name__)
+        server = ProductionServer(app, workers=3, threads=4, bind="127.0.0.1:0", graceful_timeout_s=5)
+
+        self.assertEqual(3, server.cfg.workers)
+        self.assertEqual(4, server.cfg.threads)
+        self.assertEqual(5, server.cfg.graceful_timeout)
+        self.assertTrue(server.cfg.preload_app)
+        self.assertIs(app, server.load())
+        self.assertEqual("gthread", server.cfg.worker_class_str)
+
+
+if __name__ == '__main__':
+    unittest.main()
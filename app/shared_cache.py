@@ -0,0 +1,320 @@
+import logging
+import os
+import pickle
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, wait
+
+from app.cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL_S, TTLCache
+
+
+TIMEOUT_S = 1
+LOAD_LEASE_S = 30
+CLAIM_POLL_S = 0.05
+OPERATIONS = ("get", "put", "invalidate", "clear", "time_to_live", "stats", "claim", "lease", "release")
+
+_HEADER = struct.Struct("!I")
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCacheServer(socketserver.ThreadingUnixStreamServer):
+    """
+    A local stand-in for Redis: serves caches over a Unix socket at path so every worker process on the node shares
+    them. Each namespace is a TTLCache created by the first client to use it, with that client's time to live and
+    maximum entries.
+
+    Messages are pickled, so the socket is only accessible to the user running the server. It is created that way, with
+    a umask masking every permission of the group and others, so it is never briefly open to them.
+
+    Besides the TTLCache operations a client can claim a missing key for a lease of some seconds, so that of the workers
+    missing the same key only the claimant loads it while the others wait for the value (see SharedCache.get_or_load).
+    A client can also lease a key whether or not it is cached, so that only one worker refreshes it (see
+    SharedCache.refresh).
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path, SharedCacheHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        self.path = path
+        self._lock = threading.Lock()
+        self._caches = {}
+        self._claims = {}
+        self._waits = Counter()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def execute(self, namespace, ttl_s, max_entries, op, args):
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation {op}")
+
+        with self._lock:
+            if namespace not in self._caches:
+                self._caches[namespace] = TTLCache(ttl_s=ttl_s, max_entries=max_entries)
+            cache = self._caches[namespace]
+
+        if op == "claim":
+            return self._claim(cache, namespace, *args)
+        if op == "lease":
+            return self._lease(namespace, *args)
+        if op in ("put", "invalidate", "release"):
+            with self._lock:
+                self._claims.pop((namespace, args[0]), None)
+            if op == "release":
+                return None
+        if op == "stats":
+            stats = cache.stats()
+            with self._lock:
+                return {**stats, "coalesced": stats["coalesced"] + self._waits[namespace]}
+
+        return getattr(cache, op)(*args)
+
+    def _claim(self, cache, namespace, key, lease_s, counted=True):
+        # only a client's first claim of a key counts as a hit or miss, not its polls while waiting for the value
+        value = cache.get(key, _MISSING) if counted else cache.peek(key, _MISSING)
+        if value is not _MISSING:
+            return "hit", value
+
+        if not self._lease(namespace, key, lease_s):
+            if counted:
+                with self._lock:
+                    self._waits[namespace] += 1
+            return "wait", None
+
+        return "claimed", None
+
+    def _lease(self, namespace, key, lease_s):
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._claims.get((namespace, key))
+            if expires_at is not None and expires_at > now:
+                return False
+
+            self._claims[(namespace, key)] = now + lease_s
+            return True
+
+
+class SharedCacheHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                request = _receive(self.request)
+            except (EOFError, OSError):
+                return
+
+            try:
+                response = (True, self.server.execute(*request))
+            except Exception as e:
+                response = (False, repr(e))
+            _send(self.request, response)
+
+
+class SharedCache(object):
+    """
+    A client of the SharedCacheServer at path, caching in the given namespace with the same interface as TTLCache (get,
+    put, invalidate, clear, get_or_load, refresh, time_to_live and stats), so either can back a cache.
+
+    Each thread keeps its own connection, reopened after a fork. If the server cannot be reached within timeout_s the
+    cache degrades to always missing (a warning is logged and counted in the "errors" stat) rather than failing
+    requests.
+
+    get_or_load coalesces concurrent misses within the process like TTLCache, and across processes by claiming the key
+    on the server for lease_s seconds: the claimant loads the value while the other processes poll for it, so a summary
+    missing on every worker is still fetched only once.
+    """
+
+    def __init__(self, path, namespace, ttl_s=DEFAULT_TTL_S, max_entries=DEFAULT_MAX_ENTRIES, timeout_s=TIMEOUT_S,
+                 lease_s=LOAD_LEASE_S):
+        self.path = path
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.timeout_s = timeout_s
+        self.lease_s = lease_s
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.coalesced = 0
+        self.errors = 0
+
+    def get(self, key, default=None):
+        return self._call("get", (key, default), default)
+
+    def put(self, key, value):
+        self._call("put", (key, value))
+
+    def invalidate(self, key):
+        self._call("invalidate", (key,))
+
+    def clear(self):
+        self._call("clear", ())
+
+    def time_to_live(self, key):
+        return self._call("time_to_live", (key,))
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader to produce and cache it on a miss.
+
+        If another thread of this process is already loading the same key this waits for and shares its result (or
+        error) instead, and if another process is loading it this waits for its value.
+        """
+        with self._lock:
+            future = self._loading.get(key)
+            if future is None:
+                future = self._loading[key] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = self._load_shared(key, loader)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+        future.set_result(value)
+
+        return value
+
+    def refresh(self, key, loader):
+        """
+        Replaces the cached value for key with one produced by loader, returning whether it did. The key is leased on
+        the server for the duration, so when every worker refreshes the same keys only one of them loads each, and
+        workers missing the key meanwhile wait for the refreshed value (see get_or_load). Nothing is loaded if another
+        worker holds the lease or the key's claim. A get_or_load of the key in progress in this process is waited for
+        first, as for TTLCache.
+        """
+        with self._lock:
+            loading = self._loading.get(key)
+        if loading is not None:
+            wait([loading])
+
+        if not self._call("lease", (key, self.lease_s), True):
+            return False
+
+        try:
+            value = loader()
+        except BaseException:
+            self._call("release", (key,))
+            raise
+
+        self._call("put", (key, value))
+        return True
+
+    def stats(self):
+        stats = self._call("stats", (), {"entries": 0, "hits": 0, "misses": 0, "coalesced": 0, "evictions": 0})
+        with self._lock:
+            return {**stats, "coalesced": stats["coalesced"] + self.coalesced, "errors": self.errors}
+
+    def _load_shared(self, key, loader):
+        counted = True
+        while True:
+            state, value = self._call("claim", (key, self.lease_s, counted), ("claimed", None))
+            if state == "hit":
+                return value
+            if state == "claimed":
+                break
+            counted = False
+            # another process is loading the value, its claim lapses after the lease if it never arrives
+            time.sleep(CLAIM_POLL_S)
+
+        try:
+            value = loader()
+        except BaseException:
+            self._call("release", (key,))
+            raise
+
+        self._call("put", (key, value))
+        return value
+
+    def _call(self, op, args, default=None):
+        try:
+            connection = self._connection()
+            _send(connection, (self.namespace, self.ttl_s, self.max_entries, op, args))
+            ok, result = _receive(connection)
+        except (EOFError, OSError, pickle.PickleError) as e:
+            self._disconnect()
+            with self._lock:
+                self.errors += 1
+            logger.warning("Shared cache %s unavailable: %s", self.path, e)
+            return default
+
+        if not ok:
+            logger.warning("Shared cache %s failed %s: %s", self.path, op, result)
+            return default
+
+        return result
+
+    def _connection(self):
+        pid, connection = getattr(self._local, "connection", (None, None))
+        if connection is None or pid != os.getpid():
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout_s)
+            connection.connect(self.path)
+            self._local.connection = (os.getpid(), connection)
+
+        return connection
+
+    def _disconnect(self):
+        pid, connection = getattr(self._local, "connection", (None, None))
+        self._local.connection = (None, None)
+        if connection is not None and pid == os.getpid():
+            connection.close()
+
+
+def start_server(path):
+    """
+    Starts a SharedCacheServer at path serving from a background thread, returning the server. Started before gunicorn
+    forks its workers, the server runs in the master process and so outlives any one worker.
+    """
+    server = SharedCacheServer(path)
+    threading.Thread(target=server.serve_forever, name="shared-cache", daemon=True).start()
+
+    return server
+
+
+def _send(connection, message):
+    body = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    connection.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _receive(connection):
+    size, = _HEADER.unpack(_receive_exactly(connection, _HEADER.size))
+    return pickle.loads(_receive_exactly(connection, size))
+
+
+def _receive_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError("Shared cache connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
@@ -0,0 +1,157 @@
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+import flask
+import responses
+
+from app import net
+from app.cache import TTLCache, get_summary_cache
+from app.shared_cache import CLAIM_POLL_S, SharedCache, start_server
+from app.summary import OrgSummary
+
+
+class SharedCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sock")
+        self.server = start_server(self.path)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+        net.configure()
+
+    def test_shared_between_clients(self):
+        worker_1 = SharedCache(self.path, "summaries")
+        worker_2 = SharedCache(self.path, "summaries")
+        summary = OrgSummary(original_repositories=3)
+
+        worker_1.put(("summary", "github", "org"), summary)
+
+        self.assertEqual(summary, worker_2.get(("summary", "github", "org")))
+        self.assertIsNone(SharedCache(self.path, "responses").get(("summary", "github", "org")))
+        self.assertAlmostEqual(300, worker_2.time_to_live(("summary", "github", "org")), delta=1)
+        worker_2.invalidate(("summary", "github", "org"))
+        self.assertIsNone(worker_1.get(("summary", "github", "org")))
+        self.assertEqual({"entries": 0, "hits": 1, "misses": 1, "coalesced": 0, "evictions": 0, "errors": 0},
+                         worker_1.stats())
+
+    def test_get_or_load_coalesced_across_clients(self):
+        worker_1 = SharedCache(self.path, "summaries")
+        worker_2 = SharedCache(self.path, "summaries")
+        loading = threading.Event()
+        release = threading.Event()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            loading.set()
+            release.wait()
+            return "value"
+
+        thread = threading.Thread(target=lambda: worker_1.get_or_load("key", loader))
+        thread.start()
+        loading.wait()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(worker_2.get_or_load("key", loader)))
+        waiter.start()
+        while worker_1.stats()["coalesced"] == 0:
+            time.sleep(0.001)
+        # let the waiter poll a few times, polls are not counted as misses
+        time.sleep(3 * CLAIM_POLL_S)
+        release.set()
+        thread.join()
+        waiter.join()
+
+        self.assertEqual(["value"], results)
+        self.assertEqual(1, len(loads))
+        self.assertEqual({"entries": 1, "hits": 0, "misses": 2, "coalesced": 1, "evictions": 0, "errors": 0},
+                         worker_1.stats())
+
+    def test_refresh_leased_across_clients(self):
+        worker_1 = SharedCache(self.path, "summaries")
+        worker_2 = SharedCache(self.path, "summaries")
+        worker_1.put("key", "stale")
+        loading = threading.Event()
+        release = threading.Event()
+
+        def loader():
+            loading.set()
+            release.wait()
+            return "fresh"
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(worker_1.refresh("key", loader)))
+        thread.start()
+        loading.wait()
+        self.assertFalse(worker_2.refresh("key", lambda: "other"))
+        release.set()
+        thread.join()
+
+        self.assertEqual([True], results)
+        self.assertEqual("fresh", worker_2.get("key"))
+        self.assertTrue(worker_2.refresh("key", lambda: "fresher"))
+        self.assertEqual("fresher", worker_1.get("key"))
+
+    def test_socket_private(self):
+        umask = os.umask(0o022)
+        try:
+            server = start_server(os.path.join(self.directory.name, "private.sock"))
+            self.assertEqual(0o022, os.umask(0o022))
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(server.path).st_mode))
+        server.shutdown()
+        server.server_close()
+
+    def test_get_or_load_releases_claim_on_error(self):
+        cache = SharedCache(self.path, "summaries")
+
+        with self.assertRaises(ValueError):
+            cache.get_or_load("key", lambda: int("not a number"))
+
+        self.assertEqual("value", SharedCache(self.path, "summaries").get_or_load("key", lambda: "value"))
+
+    def test_unavailable_server_misses(self):
+        cache = SharedCache(os.path.join(self.directory.name, "missing.sock"), "summaries")
+
+        with self.assertLogs("app.shared_cache", level="WARNING"):
+            cache.put("key", "value")
+            self.assertIsNone(cache.get("key"))
+            self.assertEqual("value", cache.get_or_load("key", lambda: "value"))
+        self.assertGreater(cache.stats()["errors"], 0)
+
+    def test_summary_cache_backend(self):
+        app = flask.Flask(__name__)
+        with app.app_context():
+            self.assertIsInstance(get_summary_cache(), TTLCache)
+
+        app = flask.Flask(__name__)
+        app.config["cache_socket"] = self.path
+        with app.app_context():
+            self.assertIsInstance(get_summary_cache(), SharedCache)
+
+    @responses.activate
+    def test_shared_validated_responses(self):
+        net.configure(response_cache=SharedCache(self.path, "responses", ttl_s=None))
+        responses.add(responses.GET, "http://dummy-url/etag", json={"unit-test": "data"}, status=200,
+                      headers={"ETag": '"abc"'})
+        responses.add(responses.GET, "http://dummy-url/etag", status=304)
+        net.conditional_get("http://dummy-url/etag")
+
+        # another worker revalidates the response the first one stored
+        net.configure(response_cache=SharedCache(self.path, "responses", ttl_s=None))
+        self.assertEqual({"unit-test": "data"}, net.conditional_get("http://dummy-url/etag").json())
+        calls = [call for call in responses.calls if call.request.url == "http://dummy-url/etag"]
+        self.assertEqual('"abc"', calls[1].request.headers["If-None-Match"])
+
+
+if __name__ == '__main__':
+    unittest.main()
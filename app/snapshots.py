@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+from app.summary import OrgSummary
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    provider TEXT NOT NULL,
+    name TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    summary TEXT NOT NULL,
+    repos TEXT NOT NULL,
+    full_fetched_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (provider, name)
+)
+"""
+MIGRATIONS = {
+    "full_fetched_at": "ALTER TABLE snapshots ADD COLUMN full_fetched_at REAL NOT NULL DEFAULT 0",
+}
+
+_extension_lock = threading.Lock()
+
+
+class Snapshot(object):
+    """
+    A stored org summary, the parsed repository summaries it was built from, when it was last fetched and when every
+    repository was last fetched (rather than only those updated since the previous fetch)
+    """
+
+    def __init__(self, summary, repo_summaries, fetched_at, full_fetched_at):
+        self.summary = summary
+        self.repo_summaries = repo_summaries
+        self.fetched_at = fetched_at
+        self.full_fetched_at = full_fetched_at
+
+    def age(self, now=None):
+        return (time.time() if now is None else now) - self.fetched_at
+
+
+class SnapshotStore(object):
+    """
+    A persistent SQLite store of the latest snapshot per provider and organization/team name, so that a restarted
+    process can answer from disk instead of hitting Github and Bitbucket again
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(SCHEMA)
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(snapshots)")}
+            for column, migration in MIGRATIONS.items():
+                if column not in columns:
+                    self._connection.execute(migration)
+
+    def save(self, provider, name, summary, repo_summaries, fetched_at=None, full_fetched_at=None):
+        """
+        Stores the snapshot, full_fetched_at defaults to fetched_at (i.e. every repository was fetched)
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        full_fetched_at = fetched_at if full_fetched_at is None else full_fetched_at
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO snapshots "
+                                     "(provider, name, fetched_at, summary, repos, full_fetched_at) "
+                                     "VALUES (?, ?, ?, ?, ?, ?)",
+                                     (provider, name, fetched_at, json.dumps(summary.asdict()),
+                                      json.dumps(repo_summaries), full_fetched_at))
+
+    def load(self, provider, name):
+        """
+        Returns the stored snapshot, None if there is none
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT summary, repos, fetched_at, full_fetched_at FROM snapshots "
+                                           "WHERE provider = ? AND name = ?", (provider, name)).fetchone()
+        if row is None:
+            return None
+
+        summary, repo_summaries, fetched_at, full_fetched_at = row
+        return Snapshot(OrgSummary.fromdict(json.loads(summary)), json.loads(repo_summaries), fetched_at,
+                        full_fetched_at)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def get_snapshot_store():
+    """
+    Returns the snapshot store of the current Flask application at the "snapshot_path" app config, created on first
+    use. Returns None if no path is configured, in which case nothing is persisted.
+    """
+    app = current_app._get_current_object()
+    path = app.config.get("snapshot_path")
+    if not path:
+        return None
+
+    with _extension_lock:
+        if "snapshot_store" not in app.extensions:
+            app.extensions["snapshot_store"] = SnapshotStore(path)
+
+        return app.extensions["snapshot_store"]
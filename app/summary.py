@@ -1,6 +1,6 @@
-from collections import defaultdict
+from collections import Counter
 from dataclasses import dataclass, field
-import itertools
+import sys
 
 
 @dataclass
@@ -8,13 +8,21 @@ class OrgSummary:
     """
     OrgSummary represents the aggregation of all organization/team information from multiple sources.
 
-    It acts as an accumulator and can output its accumulated values via the _asdict_ method.
+    It acts as an accumulator and can output its accumulated values via the _asdict_ method. Summaries form a monoid
+    under merge (with the empty summary as identity), so any number of them can be combined in a single pass with
+    combine_all. They only hold ints and Counters, so they pickle cheaply to ship between processes.
     """
     original_repositories: int = 0
     forked_repositories: int = 0
     watchers: int = 0
-    languages: dict = field(default_factory=lambda: defaultdict(int))
-    topics: dict = field(default_factory=lambda: defaultdict(int))
+    languages: dict = field(default_factory=Counter)
+    topics: dict = field(default_factory=Counter)
+
+    def __post_init__(self):
+        if not isinstance(self.languages, Counter):
+            self.languages = Counter(self.languages)
+        if not isinstance(self.topics, Counter):
+            self.topics = Counter(self.topics)
 
     def accumulate(self, repo_summary):
         """
@@ -39,37 +47,94 @@ class OrgSummary:
             self.original_repositories += 1
 
         for topic in repo_summary.get("topics", []):
-            self.topics[topic] += 1
+            self.topics[sys.intern(topic)] += 1
 
         self.watchers += repo_summary.get("watchers_count", 0)
-        self.languages[repo_summary["language"] or "No Language Specified"] += 1
+        self.languages[sys.intern(repo_summary["language"] or "No Language Specified")] += 1
+
+    def merge(self, org_summary):
+        """
+        Adds another org summary into this one in place
+        """
+        self.original_repositories += org_summary.original_repositories
+        self.forked_repositories += org_summary.forked_repositories
+        self.watchers += org_summary.watchers
+        self.languages.update(org_summary.languages)
+        self.topics.update(org_summary.topics)
+
+    def remove(self, repo_summary):
+        """
+        The inverse of accumulate, subtracts a previously accumulated repository summary from this organization summary
+        """
+        if repo_summary.get("private", False):
+            return
+
+        if repo_summary.get("fork", False):
+            self.forked_repositories -= 1
+        else:
+            self.original_repositories -= 1
+
+        for topic in repo_summary.get("topics", []):
+            _decrement(self.topics, topic)
+
+        self.watchers -= repo_summary.get("watchers_count", 0)
+        _decrement(self.languages, repo_summary["language"] or "No Language Specified")
 
     def asdict(self):
+        """
+        Returns the summary as a dict, its languages and topics are copies so the dict can be changed without changing a
+        cached summary
+        """
         return {
             "original_repositories": self.original_repositories,
             "forked_repositories": self.forked_repositories,
             "watchers_count": self.watchers,
             "languages": dict(self.languages),
-            "topics": self.topics
+            "topics": dict(self.topics)
         }
 
+    @classmethod
+    def fromdict(cls, summary_dict):
+        """
+        The inverse of asdict, builds an org summary from its dict representation
+        """
+        return cls(original_repositories=summary_dict["original_repositories"],
+                   forked_repositories=summary_dict["forked_repositories"],
+                   watchers=summary_dict["watchers_count"],
+                   languages=Counter(summary_dict["languages"]),
+                   topics=Counter(summary_dict["topics"]))
+
+
+def _decrement(counts, key):
+    counts[key] -= 1
+    if counts[key] <= 0:
+        del counts[key]
+
+
+def summarize(repo_summaries):
+    """
+    Accumulates an iterable of repository summaries into a new org summary
+    """
+    org_summary = OrgSummary()
+    for repo_summary in repo_summaries:
+        org_summary.accumulate(repo_summary)
+
+    return org_summary
+
 
 def combine(org_summary_1, org_summary_2):
     """
     Combine two org summaries together in additive fashion into a new org summary.
+    """
+    return combine_all((org_summary_1, org_summary_2))
 
-    It's a gross function
+
+def combine_all(org_summaries):
+    """
+    Combine any number of org summaries together in additive fashion into a new org summary, in a single pass.
     """
-    topics = defaultdict(int)
-    for topic, count in itertools.chain(org_summary_1.topics.items(), org_summary_2.topics.items()):
-        topics[topic] += count
-
-    languages = defaultdict(int)
-    for language, count in itertools.chain(org_summary_1.languages.items(), org_summary_2.languages.items()):
-        languages[language] += count
-
-    return OrgSummary(forked_repositories=org_summary_1.forked_repositories + org_summary_2.forked_repositories,
-                      original_repositories=org_summary_1.original_repositories + org_summary_2.original_repositories,
-                      watchers=org_summary_1.watchers + org_summary_2.watchers,
-                      topics=topics,
-                      languages=languages)
+    combined = OrgSummary()
+    for org_summary in org_summaries:
+        combined.merge(org_summary)
+
+    return combined
@@ -1,6 +1,7 @@
+import pickle
 import unittest
 
-from app.summary import OrgSummary, combine
+from app.summary import OrgSummary, combine, combine_all
 from app.test_data import *
 
 
@@ -28,6 +29,30 @@ class MyTestCase(unittest.TestCase):
             }
         }, org_summary.asdict())
 
+    def test_remove(self):
+        org_summary = OrgSummary()
+        org_summary.accumulate(REPO_PUBLIC)
+        org_summary.accumulate(REPO_PRIVATE)
+        org_summary.accumulate(REPO_PUBLIC_FORK)
+        org_summary.remove(REPO_PUBLIC_FORK)
+        org_summary.remove(REPO_PRIVATE)
+
+        expected = OrgSummary()
+        expected.accumulate(REPO_PUBLIC)
+        self.assertEqual(expected.asdict(), org_summary.asdict())
+
+    def test_fromdict(self):
+        org_summary = OrgSummary()
+        org_summary.accumulate(REPO_PUBLIC)
+        self.assertEqual(org_summary, OrgSummary.fromdict(org_summary.asdict()))
+
+    def test_asdict_copies_counters(self):
+        org_summary = OrgSummary()
+        org_summary.accumulate(REPO_PUBLIC)
+
+        org_summary.asdict()["languages"]["Python"] += 10
+        self.assertEqual(1, org_summary.asdict()["languages"]["Python"])
+
     def test_combine(self):
         # not inlining for readability
         expected = OrgSummary(original_repositories=1,
@@ -61,6 +86,25 @@ class MyTestCase(unittest.TestCase):
                          )
         self.assertEqual(expected, actual)
 
+    def test_combine_all(self):
+        summaries = [OrgSummary(original_repositories=1, watchers=i, languages={"Python": 1}, topics={"fun": i})
+                     for i in range(4)]
+
+        self.assertEqual(OrgSummary(original_repositories=4, watchers=6, languages={"Python": 4},
+                                    topics={"fun": 6}), combine_all(summaries))
+        self.assertEqual(OrgSummary(), combine_all([]))
+        self.assertEqual(summaries[1], combine_all(summaries[1:2]))
+
+    def test_combine_does_not_modify_inputs(self):
+        org_summary = OrgSummary(languages={"Python": 1})
+        combine(org_summary, org_summary)
+        self.assertEqual({"Python": 1}, org_summary.languages)
+
+    def test_pickle(self):
+        org_summary = OrgSummary()
+        org_summary.accumulate(REPO_PUBLIC)
+        self.assertEqual(org_summary, pickle.loads(pickle.dumps(org_summary)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -27,4 +27,22 @@ REPO_PRIVATE = {
         "programming",
         "fun"
     ]
-}
\ No newline at end of file
+}
+
+
+class FakeClock(object):
+    """
+    A clock for tests to move by hand, usable as both the clock and the sleep of the classes taking them. A sleep moves
+    the clock on and is recorded in sleeps.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
@@ -0,0 +1,85 @@
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app
+
+
+_shared_executor = contextvars.ContextVar("shared_executor", default=None)
+
+
+def with_app_context(fn):
+    """
+    Wraps fn so that it runs inside the current Flask application context, even when called from a worker thread.
+
+    Must be called while an application context is active, that context's application is captured for the workers. The
+    context variables of the caller (such as the metrics trace) are captured too, each call runs in its own copy of
+    them.
+    """
+    app = current_app._get_current_object()
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(run, *args, **kwargs)
+
+    return wrapper
+
+
+def cancel_pending(futures):
+    """
+    Cancels any of the given futures that have not started running yet
+    """
+    for future in futures:
+        future.cancel()
+
+
+@contextmanager
+def shared_executor(max_workers):
+    """
+    Runs the fan out of the body of the with statement (see fan_out_executor) on one pool of max_workers threads, so
+    that however many listings it starts, at most max_workers of their page and watcher calls run at once. Worker
+    threads started with with_app_context inherit the pool.
+
+    The fanned out calls must not fan out again themselves, or they could wait on a pool they are occupying.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    token = _shared_executor.set(executor)
+    try:
+        yield executor
+    finally:
+        _shared_executor.reset(token)
+        executor.shutdown(wait=True)
+
+
+@contextmanager
+def own_executors():
+    """
+    Clears the shared executor for the body of the with statement, so work that may outlive the caller's shared_executor
+    (such as a background refresh) fans out on pools of its own
+    """
+    token = _shared_executor.set(None)
+    try:
+        yield
+    finally:
+        _shared_executor.reset(token)
+
+
+@contextmanager
+def fan_out_executor(max_workers):
+    """
+    Yields the executor to fan calls out to: the shared executor if the caller runs within shared_executor, otherwise a
+    pool of max_workers threads of its own. An own pool is shut down on exit, once its running calls are done.
+    """
+    executor = _shared_executor.get()
+    if executor is not None:
+        yield executor
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield executor
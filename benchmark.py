@@ -0,0 +1,57 @@
+from app import benchmark, net
+from app.routes import app
+import argparse
+import json
+import logging
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Load tests /v1/profile against a local stand-in for Github and Bitbucket")
+    parser.add_argument("--profiles", type=int, default=200, help="The number of profiles to request, defaults to 200")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="The number of clients requesting profiles in parallel, defaults to 8")
+    parser.add_argument("--orgs", type=int, default=10,
+                        help="The number of distinct organizations/teams requested round robin, defaults to 10")
+    parser.add_argument("--repos", type=int, default=250,
+                        help="The number of repositories of each organization/team, defaults to 250")
+    parser.add_argument("--github-page-size", type=int, default=100,
+                        help="The most repositories the stand-in serves per Github page, defaults to 100")
+    parser.add_argument("--bitbucket-page-size", type=int, default=100,
+                        help="The most repositories the stand-in serves per Bitbucket page, defaults to 100")
+    parser.add_argument("--watchers", type=int, default=5,
+                        help="The number of watchers of each Bitbucket repository, defaults to 5")
+    parser.add_argument("--watcher-page-size", type=int, default=10,
+                        help="The most watchers the stand-in serves per Bitbucket page, defaults to 10")
+    parser.add_argument("--no-watcher-size", action="store_true",
+                        help="Leave the size out of watcher pages, so every watcher page has to be fetched")
+    parser.add_argument("--latency-ms", type=float, default=20,
+                        help="Milliseconds the stand-in delays each response by, defaults to 20")
+    parser.add_argument("--tail-ratio", type=float, default=0,
+                        help="The fraction of responses the stand-in delays further, defaults to 0")
+    parser.add_argument("--tail-latency-ms", type=float, default=500,
+                        help="Milliseconds the stand-in further delays the --tail-ratio of responses by, "
+                             "defaults to 500")
+    parser.add_argument("--cache-ttl", type=float, default=0,
+                        help="Seconds to cache summaries for, defaults to 0 so every profile is fetched upstream")
+    parser.add_argument("--github-backend", default="rest", choices=["rest", "graphql"],
+                        help="Fetch Github repositories with the REST or the GraphQL API, defaults to rest")
+    parser.add_argument("--pool-size", type=int, default=net.POOL_SIZE,
+                        help=f"The maximum pooled connections kept per host, defaults to {net.POOL_SIZE}")
+    parser.add_argument("--max-requests-per-host", type=int, default=net.MAX_REQUESTS_PER_HOST,
+                        help="The maximum concurrent requests to any one host, "
+                             f"defaults to {net.MAX_REQUESTS_PER_HOST}")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="Send a slow upstream request again once it takes longer than this percentile of recent "
+                             "requests of its kind, not hedged by default")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app.logger.setLevel(logging.WARN)
+    net.configure(max_requests_per_host=args.max_requests_per_host, pool_size=args.pool_size,
+                  hedge_percentile=args.hedge_percentile)
+
+    report = benchmark.run_benchmark(app, benchmark.create_upstream(args), profiles=args.profiles,
+                                     concurrency=args.concurrency, orgs=args.orgs,
+                                     config={"cache_ttl_s": args.cache_ttl, "github_backend": args.github_backend})
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,16 @@
+from app import shared_cache
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serves the cache shared by the workers on this node over a Unix socket")
+    parser.add_argument("socket",
+                        help="The path of the Unix socket to serve the cache at, as given to run.py --cache-socket")
+    args = parser.parse_args()
+
+    with shared_cache.SharedCacheServer(args.socket) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -1,4 +1,6 @@
-from app.routes import app
+from app import bitbucket_api, cache, github_api, logs, net, prefetch, rate_limit, shared_cache
+from app.profiles import FULL_REFRESH_S, LOAD_WORKERS
+from app.routes import BATCH_FAN_OUT_WORKERS, BATCH_WORKERS, app
 import argparse
 import flask
 import logging
@@ -6,15 +8,152 @@ import logging
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("--github-token", help="A github authorization token")
-    parser.add_argument("--bitbucket-token", help="A bitbucket authorization token")
+    parser.add_argument("--github-token", dest="github_tokens", action="append", default=[],
+                        help="A github authorization token, repeat to spread requests over a pool of tokens")
+    parser.add_argument("--bitbucket-token", dest="bitbucket_tokens", action="append", default=[],
+                        help="A bitbucket authorization token, repeat to spread requests over a pool of tokens")
     parser.add_argument("--log-level", help="The logging level for the application, defaults to INFO", default="INFO",
                         choices=["DEBUG", "INFO", "WARN", "ERROR"])
+    parser.add_argument("--log-sample-rate", type=float, default=logs.SAMPLE_RATE,
+                        help="The fraction of upstream calls logged at DEBUG level, defaults to "
+                             f"{logs.SAMPLE_RATE}")
+    parser.add_argument("--bitbucket-watcher-workers", type=int, default=bitbucket_api.WATCHER_WORKERS,
+                        help="The number of concurrent Bitbucket watcher lookups per team, "
+                             f"defaults to {bitbucket_api.WATCHER_WORKERS}")
+    parser.add_argument("--github-page-workers", type=int, default=github_api.PAGE_WORKERS,
+                        help="The number of concurrent Github repository page fetches per organization, "
+                             f"defaults to {github_api.PAGE_WORKERS}")
+    parser.add_argument("--batch-workers", type=int, default=BATCH_WORKERS,
+                        help="The number of concurrent provider fetches for a batch of profiles, "
+                             f"defaults to {BATCH_WORKERS}")
+    parser.add_argument("--batch-fan-out-workers", type=int, default=BATCH_FAN_OUT_WORKERS,
+                        help="The number of concurrent page and watcher calls shared by the provider fetches of a "
+                             f"batch, defaults to {BATCH_FAN_OUT_WORKERS}")
+    parser.add_argument("--max-requests-per-host", type=int, default=net.MAX_REQUESTS_PER_HOST,
+                        help="The maximum concurrent requests to any one host, "
+                             f"defaults to {net.MAX_REQUESTS_PER_HOST}")
+    parser.add_argument("--pool-size", type=int, default=net.POOL_SIZE,
+                        help=f"The maximum pooled connections kept per host, defaults to {net.POOL_SIZE}")
+    parser.add_argument("--no-keep-alive", action="store_true",
+                        help="Close upstream connections after each request instead of keeping them alive")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="Send a slow upstream request again once it takes longer than this percentile (0 to 100) "
+                             "of recent requests of its kind, such as 95, not hedged by default")
+    parser.add_argument("--cache-ttl", type=float, default=cache.DEFAULT_TTL_S,
+                        help=f"Seconds to cache organization summaries for, defaults to {cache.DEFAULT_TTL_S}")
+    parser.add_argument("--cache-max-entries", type=int, default=cache.DEFAULT_MAX_ENTRIES,
+                        help=f"The maximum cached summaries, defaults to {cache.DEFAULT_MAX_ENTRIES}")
+    parser.add_argument("--cache-socket",
+                        help="Cache summaries and upstream responses in the shared cache server at this Unix socket "
+                             "path, so every worker on the node shares them, cached per process by default")
+    parser.add_argument("--start-cache-server", action="store_true",
+                        help="Start the shared cache server at --cache-socket rather than connecting to one started "
+                             "with cache_server.py")
+    parser.add_argument("--github-backend", default="rest", choices=["rest", "graphql"],
+                        help="Fetch Github repositories with the REST or the GraphQL API (which needs a token), "
+                             "defaults to rest")
+    parser.add_argument("--profile-deadline", type=float,
+                        help="Seconds each provider has to respond to a profile request before the profile is returned "
+                             "without it, unbounded by default")
+    parser.add_argument("--profile-load-workers", type=int, default=LOAD_WORKERS,
+                        help="The number of provider summaries loaded at once for profile requests, including loads "
+                             f"that outlived their request's deadline, defaults to {LOAD_WORKERS}")
+    parser.add_argument("--prefetch-budget", type=float, default=0,
+                        help="Upstream calls per minute to spend refreshing the most requested summaries before they "
+                             "expire, disabled by default")
+    parser.add_argument("--prefetch-orgs", type=int, default=prefetch.HOT_ORGS,
+                        help="The number of most requested organizations/teams to keep fresh, "
+                             f"defaults to {prefetch.HOT_ORGS}")
+    parser.add_argument("--prefetch-interval", type=float, default=prefetch.INTERVAL_S,
+                        help=f"Seconds between checks for summaries to prefetch, defaults to {prefetch.INTERVAL_S}")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Serve /v1/profile from a single asyncio event loop instead of the Flask development "
+                             "server, not available in production mode")
+    parser.add_argument("--production", action="store_true",
+                        help="Serve with gunicorn worker processes instead of the development server")
+    parser.add_argument("--bind", default="127.0.0.1:5000",
+                        help="The address to serve on in production mode, defaults to 127.0.0.1:5000")
+    parser.add_argument("--workers", type=int,
+                        help="The number of worker processes in production mode, defaults to twice the CPUs plus one")
+    parser.add_argument("--threads", type=int, default=8,
+                        help="The number of request threads per worker in production mode, defaults to 8")
+    parser.add_argument("--graceful-timeout", type=float, default=30,
+                        help="Seconds workers are given to finish their requests on shutdown in production mode, "
+                             "defaults to 30")
+    parser.add_argument("--snapshot-path",
+                        help="A SQLite file to persist organization summaries in, so restarts are served from disk")
+    parser.add_argument("--snapshot-max-age", type=float, default=cache.DEFAULT_TTL_S,
+                        help="Seconds after which a persisted summary is refreshed in the background while still "
+                             f"being served, defaults to {cache.DEFAULT_TTL_S}")
+    parser.add_argument("--snapshot-full-refresh", type=float, default=FULL_REFRESH_S,
+                        help="Seconds after which a persisted summary is rebuilt from every repository rather than "
+                             f"only those updated since it was fetched, defaults to {FULL_REFRESH_S}")
+    parser.add_argument("--rate-limit-max-wait", type=float, default=rate_limit.MAX_WAIT_S,
+                        help="Seconds a request may queue for a rate limit to reset before failing, "
+                             f"defaults to {rate_limit.MAX_WAIT_S}")
+    for provider in ("github", "bitbucket"):
+        parser.add_argument(f"--{provider}-requests-per-s", type=float,
+                            help=f"Pace {provider} requests to this rate per credential, unpaced by default")
+        parser.add_argument(f"--{provider}-burst", type=int, default=1,
+                            help=f"The burst of {provider} requests allowed above the paced rate, defaults to 1")
     args = parser.parse_args()
+    if args.production and args.use_async:
+        parser.error("--async cannot be used with --production, the async server does not use the summary cache, "
+                     "snapshots, rate limiters, token pools, deadlines or metrics")
 
-    app.config["github_token"] = args.github_token
-    app.config["bitbucket_token"] = args.bitbucket_token
+    for provider in ("github", "bitbucket"):
+        tokens = getattr(args, f"{provider}_tokens")
+        app.config[f"{provider}_token"] = tokens[0] if tokens else None
+        app.config[f"{provider}_tokens"] = tokens
+    app.config["github_backend"] = args.github_backend
+    app.config["profile_deadline_s"] = args.profile_deadline
+    app.config["profile_load_workers"] = args.profile_load_workers
+    app.config["upstream_log_sample_rate"] = args.log_sample_rate
+    app.config["bitbucket_watcher_workers"] = args.bitbucket_watcher_workers
+    app.config["github_page_workers"] = args.github_page_workers
+    app.config["batch_workers"] = args.batch_workers
+    app.config["batch_fan_out_workers"] = args.batch_fan_out_workers
+    app.config["cache_ttl_s"] = args.cache_ttl
+    app.config["cache_max_entries"] = args.cache_max_entries
+    app.config["cache_socket"] = args.cache_socket
+    app.config["snapshot_path"] = args.snapshot_path
+    app.config["snapshot_max_age_s"] = args.snapshot_max_age
+    app.config["snapshot_full_refresh_s"] = args.snapshot_full_refresh
+    app.config["rate_limit_max_wait_s"] = args.rate_limit_max_wait
+    for provider in ("github", "bitbucket"):
+        app.config[f"{provider}_requests_per_s"] = getattr(args, f"{provider}_requests_per_s")
+        app.config[f"{provider}_burst"] = getattr(args, f"{provider}_burst")
+    if args.cache_socket and args.start_cache_server:
+        shared_cache.start_server(args.cache_socket)
+    net.configure(max_requests_per_host=args.max_requests_per_host, pool_size=args.pool_size,
+                  keep_alive=not args.no_keep_alive, hedge_percentile=args.hedge_percentile,
+                  response_cache=cache.create_cache("responses", ttl_s=None, max_entries=net.MAX_VALIDATED_RESPONSES,
+                                                    socket_path=args.cache_socket))
     logger = flask.logging.create_logger(app)
     logger.setLevel(logging.getLevelName(args.log_level))
+    if args.production:
+        from app.server import WORKERS, ProductionServer
 
-    app.run(debug=True)
+        workers = args.workers or WORKERS
+
+        def start_prefetch(worker_app):
+            # each worker prefetches the names it is asked for, with an even share of the budget
+            if args.prefetch_budget > 0:
+                prefetch.start_prefetch(worker_app, args.prefetch_budget / workers, hot_orgs=args.prefetch_orgs,
+                                        interval_s=args.prefetch_interval)
+
+        ProductionServer(app, workers=workers, threads=args.threads, bind=args.bind,
+                         graceful_timeout_s=args.graceful_timeout, on_worker_start=start_prefetch).run()
+    else:
+        if args.prefetch_budget > 0:
+            prefetch.start_prefetch(app, args.prefetch_budget, hot_orgs=args.prefetch_orgs,
+                                    interval_s=args.prefetch_interval)
+
+        if args.use_async:
+            from aiohttp import web
+            from app.async_routes import create_app
+
+            web.run_app(create_app(app, pool_size=args.pool_size, max_requests_per_host=args.max_requests_per_host),
+                        port=5000)
+        else:
+            app.run(debug=True)